@@ -14,9 +14,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import urllib2, sys
-from datetime import datetime
+import urllib2, sys, threading
 import splunk.client, utils
+from splunk.ingest import BatchSubmitter, EventEncoder
 
 __all__ = [
     "AnalyticsTracker",
@@ -28,6 +28,7 @@ APPLICATION_KEY = "application"
 EVENT_KEY = "event"
 DISTINCT_KEY = "distinct_id"
 EVENT_TERMINATOR = "\\r\\n-----end-event-----\\r\\n"
+EVENT_SEPARATOR = "\r\n-----end-event-----\r\n" # Matches EVENT_TERMINATOR
 PROPERTY_PREFIX = "analytics_prop__"
 
 class AnalyticsTracker:
@@ -36,21 +37,47 @@ class AnalyticsTracker:
         self.splunk = splunk.client.connect(**splunk_info)
         self.index = index
 
-        if self.index not in self.splunk.indexes.list():
+        if not self.splunk.indexes.contains(self.index):
             self.splunk.indexes.create(self.index)
 
-        assert(self.index in self.splunk.indexes.list())
+        assert(self.splunk.indexes.contains(self.index))
 
-        if ANALYTICS_SOURCETYPE not in self.splunk.confs["props"].list():
+        if not self.splunk.confs["props"].contains(ANALYTICS_SOURCETYPE):
             self.splunk.confs["props"].create(ANALYTICS_SOURCETYPE)
             stanza = self.splunk.confs["props"][ANALYTICS_SOURCETYPE]
             stanza.submit("LINE_BREAKER = (%s)" % EVENT_TERMINATOR)
             stanza.submit("CHARSET = UTF-8")
             stanza.submit("SHOULD_LINEMERGE = false")
 
-    @staticmethod
-    def encode(props):
-        encoded = " ";
+        # Tracked events are batched, several to a request
+        self.submitter = BatchSubmitter(self.splunk, separator=EVENT_SEPARATOR)
+        # An EventEncoder reuses its buffer, so each thread gets its own
+        self.local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        """Send any events not yet sent."""
+        self.submitter.close()
+
+    # Returns the calling thread's encoder, created on first use
+    def encoder(self):
+        encoder = getattr(self.local, "encoder", None)
+        if encoder is None:
+            encoder = EventEncoder(
+                [APPLICATION_KEY, EVENT_KEY], timestamp=True)
+            self.local.encoder = encoder
+        return encoder
+
+    def track(self, event_name, time = None, distinct_id = None, **props):
+        assert(not APPLICATION_KEY in props.keys())
+        assert(not EVENT_KEY in props.keys())
+
+        values = {}
         for k,v in props.iteritems():
             # We disallow dictionaries - it doesn't quite make sense.
             assert(not isinstance(v, dict))
@@ -58,30 +85,18 @@ class AnalyticsTracker:
             # We do not allow lists
             assert(not isinstance(v, list))
 
-            # This is a hack to escape quotes
-            if isinstance(v, str):
-                v = v.replace('"', "'")
-
-            encoded += ('%s%s="%s" ' % (PROPERTY_PREFIX, k, v))
+            values[PROPERTY_PREFIX + k] = v
 
-        return encoded
-
-    def track(self, event_name, time = datetime.now().isoformat(), distinct_id = None, **props):
-        event = '%s %s="%s" %s="%s" ' % (
-            time,
-            APPLICATION_KEY, self.application_name, 
-            EVENT_KEY, event_name)
-
-        assert(not APPLICATION_KEY in props.keys())
-        assert(not EVENT_KEY in props.keys())
+        values[APPLICATION_KEY] = self.application_name
+        values[EVENT_KEY] = event_name
 
         if distinct_id is not None:
-            event += ('%s="%s" ' % (DISTINCT_KEY, distinct_id))
+            values[DISTINCT_KEY] = distinct_id
             assert(not DISTINCT_KEY in props.keys())
 
-        event += AnalyticsTracker.encode(props)
-
-        self.splunk.indexes[self.index].submit(event, sourcetype=ANALYTICS_SOURCETYPE)
+        self.submitter.submit(
+            self.encoder().encode(values, time),
+            self.index, sourcetype=ANALYTICS_SOURCETYPE)
 
 def main():
     usage = ""
@@ -89,9 +104,9 @@ def main():
     argv = sys.argv[1:]
 
     splunk_opts = utils.parse(argv, {}, ".splunkrc", usage=usage)
-    tracker = AnalyticsTracker("cli_app", splunk_opts.kwargs)
-    
-    #tracker.track("test_event", "abc123", foo="bar", bar="foo")
+    with AnalyticsTracker("cli_app", splunk_opts.kwargs) as tracker:
+        #tracker.track("test_event", "abc123", foo="bar", bar="foo")
+        pass
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
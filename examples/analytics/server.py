@@ -144,10 +144,9 @@ def main():
     splunk_opts = opts.kwargs
 
     global tracker
-    tracker = AnalyticsTracker("analytics", splunk_opts)
-
-    debug(True)
-    run(reloader=True)
+    with AnalyticsTracker("analytics", splunk_opts) as tracker:
+        debug(True)
+        run(reloader=True)
 
 if __name__ == "__main__":
     main()
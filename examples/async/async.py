@@ -40,17 +40,22 @@ def _spliturl(url):
 
 def main(argv):
     global urllib2
-    usage = "async.py <sync | async>"
+    usage = "async.py <sync | async | pool>"
 
     # Parse the command line args.
     opts = parse(argv, {}, ".splunkrc")
 
     # We have to see if we got either the "sync" or
     # "async" command line arguments.
-    allowed_args = ["sync", "async"]
+    allowed_args = ["sync", "async", "pool"]
     if len(opts.args) == 0 or opts.args[0] not in allowed_args:
         error("Must supply either of: %s" % allowed_args, 2)
 
+    # The "pool" mode needs neither `eventlet` nor a custom handler, it uses
+    # the SDK's own `AsyncService`.
+    if opts.args[0] == "pool":
+        return run_pool(opts)
+
     # Note whether or not we are async.
     is_async = opts.args[0] == "async"
 
@@ -89,33 +94,6 @@ def main(argv):
 
         return results
 
-    # We specify many queries to get show the advantages
-    # of paralleism.
-    queries = [
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-        'search * | head 100',
-    ]
-
     # Check if we are async or not, and execute all the
     # specified queries.
     if is_async:
@@ -127,19 +105,70 @@ def main(argv):
         # If we are async, we use our worker pool to farm
         # out all the queries. We just pass, as we don't
         # actually care about the result.
-        for results in pool.imap(do_search, queries):
+        for results in pool.imap(do_search, QUERIES):
             pass
     else:
         # If we are sync, then we just execute the queries one by one,
         # and we can also ignore the result.
-        for query in queries:
+        for query in QUERIES:
             do_search(query)
     
     # Record the current time at the end of the benchmark,
     # and print the delta elapsed time.
     newtime = datetime.datetime.now()
     print "Elapsed Time: %s" % (newtime - oldtime)
-    
+
+def run_pool(opts):
+    # Create the service, its requests run on a pool of 16 worker threads
+    # that share a pool of keep-alive connections, and return futures.
+    service = splunk.client.AsyncService(workers=16, **opts.kwargs)
+    service.login().result()
+
+    oldtime = datetime.datetime.now()
+
+    # Create all the jobs up front, each `create` returns immediately
+    # with a future for the job.
+    pending = [
+        service.jobs.create(query, exec_mode="blocking") 
+        for query in QUERIES]
+
+    # Then wait for each job, and fetch its results and cancel it, again
+    # without waiting on each individual request.
+    jobs = [future.result() for future in pending]
+    results = [job.results() for job in jobs]
+    for future in results: future.result().read()
+    for future in [job.cancel() for job in jobs]: future.result()
+
+    newtime = datetime.datetime.now()
+    print "Elapsed Time: %s" % (newtime - oldtime)
+    service.close()
+
+# We specify many queries to get show the advantages
+# of paralleism.
+QUERIES = [
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+    'search * | head 100',
+]
 
 ##### Custom `urllib2`-based HTTP handler
 
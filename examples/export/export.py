@@ -22,7 +22,6 @@ using a parameterized chunking mechanism.
 # installation support files
 import sys
 import operator
-import time
 import os
 
 # splunk support files
@@ -105,16 +104,9 @@ def query(context, start, end, span, index):
 
     squery = squery + "count"
 
-    retry = True
-    while retry:
-        result = context.get('search/jobs/export', search=squery, 
-                              output_mode="csv")
-        if result.status != 200:
-            print "Failed to get event counts, HTTP status=%d, retrying"\
-                   % result.status
-            time.sleep(10)
-        else:
-            retry = False
+    # failed requests are retried by the context's retry policy
+    result = context.get('search/jobs/export', search=squery, 
+                          output_mode="csv")
 
     # generate a list of lines from teh csv return data
     lines = result.body.read().splitlines()
@@ -372,46 +364,34 @@ def export(options, context, bucket_list):
             if options.kwargs['progress']:
                 print "SKIPPING BUCKET:-------- %s" % str(bucket)
         else:
-            retry = True
-            retry_count = 0
-            while retry:
-                if options.kwargs['progress']:
-                    print "PROCESSING BUCKET:------ %s" % str(bucket)
-                # generate a search.
-                squery = "search * index=%s " % options.kwargs['index']
-                squery = squery + "timeformat=%s "
-
-                start = bucket[1]
-                quantum = bucket[2]
-
-                squery = squery + "starttime=%d " % start
-                squery = squery + "endtime=%d " % (start+quantum)
-    
-                # issue query to splunkd
-                # count=0 overrides the maximum number of events
-                # returned (normally 50K) regardless of what the .conf
-                # file for splunkd says. 
+            if options.kwargs['progress']:
+                print "PROCESSING BUCKET:------ %s" % str(bucket)
+            # generate a search.
+            squery = "search * index=%s " % options.kwargs['index']
+            squery = squery + "timeformat=%s "
+
+            start = bucket[1]
+            quantum = bucket[2]
+
+            squery = squery + "starttime=%d " % start
+            squery = squery + "endtime=%d " % (start+quantum)
+
+            # issue query to splunkd
+            # count=0 overrides the maximum number of events
+            # returned (normally 50K) regardless of what the .conf
+            # file for splunkd says. Failed requests are retried by the
+            # context's retry policy, up to RETRY_LIMIT times.
+            try:
                 result = context.get('search/jobs/export', 
-                                 search=squery, 
-                                 output_mode=options.kwargs['omode'],
-                                 count=0)
-                                 #count=int(bucket[0])+1)
-
-                if result.status != 200:
-                    retry_count = retry_count + 1
-                    if options.kwargs['progress']:
-                        print "HTTP status: %d, sleep and retry..." % \
-                              result.status
-
-                    if retry_count > RETRY_LIMIT:
-                        print "RETRY_LIMIT reached, halting export. you can"
-                        print " resume the export at a later date using the"
-                        print " --restart flag"
-                        return False
-
-                    time.sleep(10)
-                else:
-                    retry = False
+                                     search=squery, 
+                                     output_mode=options.kwargs['omode'],
+                                     count=0)
+            except (binding.HTTPError, binding.CircuitOpenError) as e:
+                print "Error: %s" % e
+                print "RETRY_LIMIT reached, halting export. you can"
+                print " resume the export at a later date using the"
+                print " --restart flag"
+                return False
 
             # write export file 
             # N.B.: atomic writes in python don't seem to exist. In order
@@ -479,9 +459,14 @@ def main():
     connection = connect(**options.kwargs)
 
     # get lower level context.
+    # failed export requests are retried with backoff, waiting at most
+    # 10 seconds between attempts, and without failing fast.
+    retry = binding.RetryPolicy(
+        retries=RETRY_LIMIT, maxdelay=10, budget=None, threshold=RETRY_LIMIT)
     context = binding.connect( host=connection.host, 
                                username=connection.username,
-                               password=connection.password)
+                               password=connection.password,
+                               retry=retry)
 
     # open restart file.
     rfd = None
@@ -52,7 +52,8 @@ def main():
         utils.error("Search expression required", 2)
     search = opts.args[0]
 
-    service = client.connect(**opts.kwargs)
+    # Log in again if the session expires while we are following
+    service = client.connect(autologin=True, **opts.kwargs)
 
     job = service.jobs.create(
         search, 
@@ -62,18 +63,13 @@ def main():
 
     # Wait for the job to transition out of QUEUED and PARSING so that
     # we can if its a transforming search, or not.
-    while True:
-        entity = job.read()
-        state = entity['dispatchState']
-        if state not in ['QUEUED', 'PARSING']:
-            break
-        time.sleep(2) # Wait
+    job.wait(states=["RUNNING", "PAUSED", "FINALIZING", "FAILED", "DONE"])
         
-    if entity['reportSearch'] is not None: # Is it a transforming search?
-        count = lambda: int(job['numPreviews'])
+    if job['reportSearch'] is not None: # Is it a transforming search?
+        count = lambda: int(job.refresh()['numPreviews'])
         items = lambda _: job.preview()
     else:
-        count = lambda: int(job['eventCount'])
+        count = lambda: int(job.refresh()['eventCount'])
         items = lambda offset: job.events(offset=offset)
     
     try:
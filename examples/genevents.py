@@ -16,11 +16,11 @@
 
 """A tool to generate event data to a named index."""
 
-import socket
 import sys
 import time
 import datetime
 from splunk.client import connect
+from splunk.ingest import BatchSubmitter, InputSender
 from utils import parse
 
 SPLUNK_HOST = "localhost"
@@ -39,7 +39,7 @@ RULES = {
         'default': "127.0.0.1",
         'help': "input host when using tcp ingest, default is localhost"
     },
-   'type': {
+   'inputport': {
         'flags': ["--inputport"],
         'default': SPLUNK_PORT,
         'help': "input host port when using tcp ingest, default is %d" % \
@@ -61,18 +61,16 @@ def feed_index(service, opts):
         print "Index %s not found" % indexname
         return
 
-    if itype in ["stream", "submit"]:
-        stream = index.attach()
+    if itype == "stream":
+        stream = writer = index.attach()
+    elif itype == "submit":
+        submitter = writer = BatchSubmitter(service)
     else:
-        # create a tcp input if one doesn't exist
+        # send to a tcp input, creating it if it doesn't exist
         input_host = opts.kwargs.get("inputhost", SPLUNK_HOST)
         input_port = int(opts.kwargs.get("inputport", SPLUNK_PORT))
-        input_name = "tcp:%s" % (input_port)
-        if input_name not in service.inputs.list():
-            service.inputs.create("tcp", input_port, index=indexname)
-        # connect to socket
-        ingest = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        ingest.connect((input_host, input_port))
+        ingest = writer = InputSender(
+            service, input_port, hosts=[input_host], index=indexname)
 
     count = 0
     lastevent = ""
@@ -85,9 +83,9 @@ def feed_index(service, opts):
                 if itype == "stream":
                     stream.write(lastevent + "\n")
                 elif itype == "submit":
-                    index.submit(lastevent + "\n")
+                    submitter.submit(lastevent + "\n", indexname)
                 else:
-                    ingest.send(lastevent + "\n")
+                    ingest.write(lastevent + "\n")
 
                 count = count + 1
             
@@ -96,6 +94,11 @@ def feed_index(service, opts):
     except KeyboardInterrupt:
         print "^C detected, last event written:"
         print lastevent
+    finally:
+        writer.close()
+        stats = writer.stats()
+        print "sent %d events, %d bytes (%d events/sec)" % (
+            stats.events, stats.bytes, stats.events_per_sec)
 
 def main():
     usage = "usage: %prog [options] <command> [<args>]"
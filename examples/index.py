@@ -103,9 +103,10 @@ class Program:
                 print "    %s: %s" % (key, value)
 
         if len(argv) == 0:
-            for index in self.service.indexes:
-                count = index['totalEventCount']
-                print "%s (%s)" % (index.name, count)
+            # The listing carries each index's state, so a single request
+            # covers all of them.
+            for index in self.service.indexes.items():
+                print "%s (%s)" % (index.name, index.state.totalEventCount)
         else:
             self.foreach(argv, read)
 
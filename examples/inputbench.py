@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""A script that benchmarks the ways of sending events to an index: over a
+   raw TCP input with a send() per field (as the examples used to), with
+   an InputSender, or through the HTTP streaming (stream) or simple
+   (submit) receivers, eg: './inputbench.py --mode=sender main'. Each mode
+   sends the same events and reports its throughput, the default mode
+   'all' runs each of them in turn."""
+
+import socket
+import sys
+import time
+
+from splunk.client import connect
+from splunk.data import record
+from splunk.ingest import BatchSubmitter, EventEncoder, InputSender
+
+from utils import *
+
+MODES = ["fields", "sender", "stream", "submit"]
+
+RULES = {
+    'mode': {
+        'flags': ["--mode"],
+        'default': "all",
+        'help': "how events are sent, one of %s or all" % MODES
+    },
+    'count': {
+        'flags': ["--count"],
+        'default': 50000,
+        'help': "number of events to send, default is 50000"
+    },
+    'fields': {
+        'flags': ["--fields"],
+        'default': 15,
+        'help': "number of fields per event, default is 15"
+    },
+    'inputport': {
+        'flags': ["--inputport"],
+        'default': 9002,
+        'help': "TCP input port, created if need be, default is 9002"
+    },
+}
+
+# Returns count events, each a dict of the given number of fields
+def generate(count, fields):
+    return [dict(("field%d" % j, "value %d" % (i + j))
+                 for j in range(fields))
+            for i in range(count)]
+
+# Returns the throughput of sending the given number of events and bytes
+# since the given time, in the form of the writers' stats
+def throughput(started, events, bytes):
+    seconds = max(time.time() - started, 1e-6)
+    return record({
+        'events': events, 'bytes': bytes, 'seconds': seconds,
+        'events_per_sec': events/seconds, 'bytes_per_sec': bytes/seconds})
+
+# Send each field of each event with its own send() on a raw socket, not
+# checking for partial sends, the pattern that InputSender replaces.
+def fields(service, index, port, events):
+    inputs = service.inputs
+    if not inputs.contains(inputs.itemkey("tcp", port)):
+        inputs.create("tcp", port, index=index)
+    started = time.time()
+    connection = socket.create_connection((service.host, port))
+    sent = 0
+    try:
+        for event in events:
+            for name, value in event.iteritems():
+                sent += connection.send('%s="%s" ' % (name, value))
+            sent += connection.send("\n")
+    finally:
+        connection.close()
+    return throughput(started, len(events), sent)
+
+# Encode and write each event with the given write function, then close
+# the given writer, answering its stats.
+def send(writer, write, events):
+    encoder = EventEncoder(terminator="\n")
+    try:
+        for event in events: write(encoder.encode(event))
+    finally:
+        writer.close()
+    return writer.stats()
+
+def sender(service, index, port, events):
+    writer = InputSender(service, port, index=index)
+    return send(writer, writer.write, events)
+
+def stream(service, index, port, events):
+    writer = service.indexes[index].attach()
+    return send(writer, writer.write, events)
+
+def submit(service, index, port, events):
+    writer = BatchSubmitter(service)
+    return send(writer, lambda event: writer.submit(event, index), events)
+
+def main(argv):
+    usage = "usage: %prog [options] <index>"
+    opts = parse(argv, RULES, ".splunkrc", usage=usage)
+
+    if len(opts.args) == 0: error("Index name required", 2)
+    index = opts.args[0]
+
+    mode = opts.kwargs['mode']
+    if mode != "all" and mode not in MODES:
+        error("Mode must be one of %s or all" % MODES, 2)
+    modes = MODES if mode == "all" else [mode]
+
+    service = connect(**dslice(opts.kwargs, FLAGS_SPLUNK))
+    if not service.indexes.contains(index):
+        error("Index '%s' does not exist." % index)
+
+    events = generate(int(opts.kwargs['count']), int(opts.kwargs['fields']))
+    port = int(opts.kwargs['inputport'])
+    functions = {
+        'fields': fields,
+        'sender': sender,
+        'stream': stream,
+        'submit': submit
+    }
+    for mode in modes:
+        stats = functions[mode](service, index, port, events)
+        print "%-6s %d events, %d bytes in %f secs = " \
+              "%f events/sec, %f MB/sec" % (
+              mode, stats.events, stats.bytes, stats.seconds,
+              stats.events_per_sec, stats.bytes_per_sec / (1024 * 1024))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
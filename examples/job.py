@@ -160,8 +160,10 @@ class Program:
 
         if len(argv) == 0:
             index = 0
-            for job in self.service.jobs:
-                print "@%d : %s" % (index, job.sid)
+            # The listing carries each job's state, no need to read them
+            for job in self.service.jobs.items():
+                state = job.state.dispatchState
+                print "@%d : %s (%s)" % (index, job.sid, state)
                 index += 1
             return
 
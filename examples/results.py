@@ -16,7 +16,9 @@
 
 """A script that reads XML search results from stdin and pretty-prints them
    back to stdout. The script is designed to be used with the search.py 
-   example, eg: './search.py "search 404" | ./results.py'"""
+   example, eg: './search.py "search 404" | ./results.py'. An optional 
+   mode argument selects another action: 'summary', 'timeit' (results read
+   per second) or 'copies' (bytes copied per MB by the stream splicer)."""
  
 from pprint import pprint
 import sys
@@ -66,5 +68,49 @@ def timeit():
     delta = time.time() - start
     print "%d results in %f secs = %f results/sec" % (count, delta, count/delta)
 
+# A source that hands out the chunks of the given data, remembering every
+# string it returned so that copies made downstream can be told apart.
+class ChunkSource:
+    def __init__(self, data, size):
+        self.chunks = [data[i:i+size] for i in xrange(0, len(data), size)]
+        self.chunks.reverse()
+        self.ids = set()
+        self.keep = [] # Keep returned strings alive so ids stay unique
+
+    def read(self, size):
+        if len(self.chunks) == 0: return ""
+        chunk = self.chunks.pop()
+        if len(chunk) > size:
+            self.chunks.append(chunk[size:])
+            chunk = chunk[:size]
+        self.ids.add(id(chunk))
+        self.keep.append(chunk)
+        return chunk
+
+def copies():
+    data = sys.stdin.read()
+    size = 16 * 1024 # The parser's read size
+    source = ChunkSource(data, size)
+    start = time.time()
+    stream = results.XMLStream(source)
+    delivered = copied = 0
+    while True:
+        chunk = stream.read(size)
+        if len(chunk) == 0: break
+        delivered += len(chunk)
+        if id(chunk) not in source.ids: copied += len(chunk)
+    delta = time.time() - start
+    megabytes = len(data) / float(1024 * 1024)
+    print "%d bytes in, %d bytes out in %f secs" % (
+        len(data), delivered, delta)
+    print "%d bytes copied = %f bytes copied per MB" % (
+        copied, copied / megabytes)
+
 if __name__ == "__main__":
-    pretty()
+    modes = { 
+        'copies': copies, 
+        'pretty': pretty, 
+        'summary': summary, 
+        'timeit': timeit 
+    }
+    modes[sys.argv[1] if len(sys.argv) > 1 else 'pretty']()
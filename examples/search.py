@@ -75,7 +75,8 @@ def main(argv):
         return
 
     job = service.jobs.create(search, **kwargs_create)
-    while True:
+    if verbose == 0: job.wait()
+    while verbose > 0: # Report progress until done
         stats = job.read(
             'isDone', 
             'doneProgress', 
@@ -86,13 +87,12 @@ def main(argv):
         scanned = int(stats['scanCount'])
         matched = int(stats['eventCount'])
         results = int(stats['resultCount'])
-        if verbose > 0:
-            status = ("\r%03.1f%% | %d scanned | %d matched | %d results" % (
-                progress, scanned, matched, results))
-            sys.stdout.write(status)
-            sys.stdout.flush()
+        status = ("\r%03.1f%% | %d scanned | %d matched | %d results" % (
+            progress, scanned, matched, results))
+        sys.stdout.write(status)
+        sys.stdout.flush()
         if stats['isDone'] == '1': 
-            if verbose > 0: sys.stdout.write('\n')
+            sys.stdout.write('\n')
             break
         sleep(2)
 
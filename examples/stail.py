@@ -33,7 +33,8 @@ def main():
         utils.error("Search expression required", 2)
     search = opts.args[0]
 
-    service = connect(**opts.kwargs)
+    # Log in again if the session expires while we are tailing
+    service = connect(autologin=True, **opts.kwargs)
 
     try:
         result = service.get(
@@ -20,10 +20,10 @@ import base64
 from getpass import getpass
 import httplib
 import json
-import socket
 import sys
 
 import splunk.client
+from splunk.ingest import EventEncoder, InputSender
 
 from utils import error, parse
 
@@ -33,7 +33,8 @@ TWITTER_STREAM_PATH = "/1/statuses/sample.json"
 DEFAULT_SPLUNK_HOST = "localhost"
 DEFAULT_SPLUNK_PORT = 9001
 
-ingest = None       # The splunk ingest socket
+ingest = None       # The splunk input sender
+encoder = EventEncoder(terminator="\r\n---end-status---\r\n")
 verbose = 1
 
 class Twitter:
@@ -175,34 +176,14 @@ you don't have any other open instances of the 'twitted' sample app.""", 2)
 def output(record):
     print_record(record)
 
-    for k in sorted(record.keys()):
-        if k.endswith("_str"): 
-            continue # Ignore
+    # Field renames
+    renames = { 'source': "status_source" }
+    values = dict((renames.get(k, k), v)
+                  for k, v in record.iteritems()
+                  if not k.endswith("_str")) # Ignore
 
-        v = record[k]
-
-        if v is None:
-            continue # Ignore
-
-        if isinstance(v, list):
-            if len(v) == 0: continue
-            v = ','.join([str(item) for item in v])
-
-        # Field renames
-        k = { 'source': "status_source" }.get(k, k)
-
-        if isinstance(v, str):
-            format = '%s="%s" '
-            v = v.replace('"', "'")
-        else:
-            format = "%s=%r "
-        result = format % (k, v)
-
-        ingest.send(result)
-
-    end = "\r\n---end-status---\r\n"
     try: 
-        ingest.send(end)
+        ingest.write(encoder.encode(values))
     except:
         error("There was an error with the TCP connection to Splunk.", 2)
 
@@ -244,22 +225,17 @@ def main():
     service = splunk.client.connect(**kwargs)
 
     # Create the index if it doesn't exist
-    if "twitter" not in service.indexes.list():
+    if not service.indexes.contains("twitter"):
         if verbose > 0: print "Creating index 'twitter' .."
         service.indexes.create("twitter")
 
     # Create the TCP input if it doesn't exist
     input_host = kwargs.get("inputhost", DEFAULT_SPLUNK_HOST)
     input_port = int(kwargs.get("inputport", DEFAULT_SPLUNK_PORT))
-    input_name = "tcp:%s" % (input_port)
-    if input_name not in service.inputs.list():
-        if verbose > 0: print "Creating input '%s'" % input_name
-        service.inputs.create(
-            "tcp", input_port, index="twitter", sourcetype="twitter")
-    
+    if verbose > 0: print "Opening input 'tcp:%s'" % input_port
     global ingest
-    ingest = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    ingest.connect((input_host, input_port))
+    ingest = InputSender(service, input_port, hosts=[input_host],
+                         index="twitter", sourcetype="twitter")
 
     if verbose > 0: 
         print "Listening (and sending data to %s:%s).." % (input_host, input_port)
@@ -272,6 +248,8 @@ def main():
 you don't have other running instances of the 'twitted' sample app, and try 
 again.""", 2)
         print e
+    finally:
+        ingest.close()
         
 if __name__ == "__main__":
     main()
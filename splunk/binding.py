@@ -14,26 +14,59 @@
 
 """Low-level 'binding' interface to the Splunk REST API."""
 
+from cStringIO import StringIO
 import httplib
+import inspect
+import json
+import os
 import socket
 import ssl
+import stat
+import sys
+import tempfile
+import threading
+from time import time
 import urllib
+import zlib
 
 from xml.etree.ElementTree import XML
 
 from splunk.data import record
+from splunk.executor import DEFAULT_WORKERS, Executor, Future
+from splunk.pool import DEFAULT_IDLETIME, DEFAULT_POOLSIZE, ConnectionPool
+from splunk.pool import spliturl
+from splunk.retry import IDEMPOTENT_METHODS, CircuitOpenError, RetryPolicy
+from splunk.stats import RequestStats, template
 
 __all__ = [
+    "AsyncContext",
+    "CircuitOpenError",
     "connect",
+    "ConnectionPool",
     "Context",
+    "Executor",
+    "Future",
     "handler",
     "HTTPError",
+    "RequestStats",
+    "RetryPolicy",
+    "TokenCache",
 ]
 
 DEFAULT_HOST = "localhost"
 DEFAULT_PORT = "8089"
 DEFAULT_SCHEME = "https"
 
+DEFAULT_TOKENCACHE = "~/.splunktokens"
+
+# Response bodies up to this size are read eagerly so that the connection
+# can go back to the pool even if the caller never reads the body.
+PRELOAD_SIZE = 64 * 1024
+
+DECODE_SIZE = 16 * 1024 # Compressed bytes read at a time when decoding
+
+CHUNK_SIZE = 64 * 1024 # Bytes read at a time from a streamed request body
+
 # Construct an URL prefix from the given scheme, host and port.
 # kwargs: scheme, host, port
 def prefix(**kwargs):
@@ -42,10 +75,62 @@ def prefix(**kwargs):
     port = kwargs.get("port", DEFAULT_PORT)
     return "%s://%s:%s" % (scheme, host, port)
 
+# Token cache file path => the lock shared by every TokenCache of the file
+_tokenlocks = {}
+_tokenlockslock = threading.Lock()
+
+class TokenCache(object):
+    """A file of session tokens keyed by (host, port, username, namespace)
+       that is readable and writable only by its owner."""
+    def __init__(self, filepath=DEFAULT_TOKENCACHE):
+        self.filepath = os.path.abspath(os.path.expanduser(filepath))
+        with _tokenlockslock:
+            self._lock = _tokenlocks.setdefault(
+                self.filepath, threading.Lock())
+
+    def _load(self):
+        try:
+            with open(self.filepath) as file:
+                return json.load(file)
+        except (IOError, ValueError):
+            return {} # Missing or unreadable, start over
+
+    # Write to a private temp file and rename it into place, so that readers
+    # never see a partial file. mkstemp creates the temp file with a unique
+    # name and private mode, so savers never share one.
+    def _save(self, tokens):
+        directory, name = os.path.split(self.filepath)
+        fd, temp = tempfile.mkstemp(prefix=name + ".", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as file: json.dump(tokens, file)
+            if os.name == "nt" and os.path.exists(self.filepath):
+                os.remove(self.filepath) # Windows won't rename over a file
+            os.rename(temp, self.filepath)
+        except:
+            if os.path.exists(temp): os.remove(temp)
+            raise
+
+    @staticmethod
+    def key(host, port, username, namespace):
+        return "%s:%s:%s:%s" % (host, port, username, namespace or "")
+
+    def get(self, key):
+        """Returns the cached token for the given key, or None."""
+        with self._lock:
+            return self._load().get(key, None)
+
+    def set(self, key, token):
+        """Cache the given token under the given key."""
+        with self._lock:
+            tokens = self._load()
+            tokens[key] = token
+            self._save(tokens)
+
 class Context:
-    # kwargs: scheme, host, port, username, password, namespace
+    # kwargs: scheme, host, port, username, password, namespace, autologin,
+    #         tokencache, retry
     def __init__(self, handler=None, **kwargs):
-        self.http = HttpLib(handler)
+        self.http = HttpLib(handler, kwargs.get("retry", None))
         self.token = None
         self.prefix = prefix(**kwargs)
         self.scheme = kwargs.get("scheme", DEFAULT_SCHEME)
@@ -54,10 +139,97 @@ class Context:
         self.username = kwargs.get("username", "")
         self.password = kwargs.get("password", "")
         self.namespace = kwargs.get("namespace", None)
+        self.autologin = kwargs.get("autologin", False)
+        self.tokencache = kwargs.get("tokencache", None)
+        if isinstance(self.tokencache, basestring):
+            self.tokencache = TokenCache(self.tokencache)
+        self._loginlock = threading.Lock()
+        self._cachedtoken = None # Cached token, not yet validated
+        self._executor = None # Shared worker pool, see executor
+        self._executorlock = threading.Lock()
+
+    # Issue a request with the given HttpLib function. If autologin is 
+    # enabled and the session has expired (401), log in again and replay the
+    # request if it is idempotent. Concurrent requests that fail with the
+    # same token share a single login. A rejected cached token is always
+    # replaced, and the request replayed, since it may have expired long 
+    # before this context was created. Requests with a streamed body can't
+    # be replayed, since the body has already been consumed. The kwargs are
+    # the request's query arguments, so the parameters are named so as not
+    # to clash with them.
+    def _call(self, _method, _func, _url, *args, **kwargs):
+        token = self.token
+        try:
+            return _func(_url, self._headers(token), *args, **kwargs)
+        except HTTPError as e:
+            if e.status != 401: raise
+            cached = token is not None and token == self._cachedtoken
+            if not self.autologin and not cached: raise
+            self._relogin(token)
+            if not replayable(kwargs.get("body", None)): raise
+            if _method not in IDEMPOTENT_METHODS and not cached: raise
+        return _func(_url, self._headers(), *args, **kwargs)
+
+    # Issue the given requests as batch does, returning their Futures, so
+    # that a caller can re-raise a failed request's error with its traceback.
+    def _futures(self, requests, concurrency):
+        methods = { 'DELETE': self.delete, 'GET': self.get, 'POST': self.post }
+        calls = [(methods[request[0].upper()], request[1],
+                  request[2] if len(request) > 2 else {})
+                 for request in requests]
+        executor = self.executor(concurrency)
+        futures = []
+        if executor.inworker():
+            for func, path, kwargs in calls:
+                future = Future()
+                try:
+                    future.set_result(func(path, **kwargs))
+                except Exception:
+                    future.set_exception(sys.exc_info())
+                futures.append(future)
+            return futures
+        slots = threading.Semaphore(concurrency) # Requests in flight
+        def call(func, path, kwargs):
+            try:
+                return func(path, **kwargs)
+            finally:
+                slots.release()
+        for func, path, kwargs in calls:
+            slots.acquire()
+            futures.append(executor.submit(call, func, path, kwargs))
+        return futures
 
     # Shared per-context request headers
-    def _headers(self):
-        return [("Authorization", self.token)]
+    def _headers(self, token=None):
+        if token is None: token = self.token
+        return [("Authorization", token)]
+
+    # Renew the session, unless another thread already replaced the given
+    # (expired) token while we waited for the lock.
+    def _relogin(self, token):
+        with self._loginlock:
+            if self.token == token: self.login()
+
+    # requests: [(method, path) | (method, path, kwargs)*]
+    def batch(self, requests, concurrency=DEFAULT_WORKERS):
+        """Issue the given requests concurrently, at most concurrency at a 
+           time, and return the list of responses in request order. A 
+           request that fails contributes its exception to the list in place
+           of a response, rather than raising. Called from one of the
+           context's workers, the requests are issued one at a time on the
+           calling worker."""
+        results = []
+        for future in self._futures(requests, concurrency):
+            error = future.exception()
+            results.append(future.result() if error is None else error)
+        return results
+
+    def close(self):
+        """Shut down the context's worker threads, if any, see executor."""
+        with self._executorlock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None: executor.shutdown()
 
     def connect(self):
         """Open a connection (socket) to the service (host:port)."""
@@ -67,27 +239,71 @@ class Context:
 
     def delete(self, path, **kwargs):
         """Issue a DELETE request to the given path."""
-        return self.http.delete(self.url(path), self._headers(), **kwargs)
+        return self._call("DELETE", self.http.delete, self.url(path), **kwargs)
+
+    def executor(self, workers=DEFAULT_WORKERS):
+        """Returns the Executor shared by the context's concurrent requests
+           (see batch), created on first use and grown to at least the
+           given number of workers. The pooled handler keeps a connection
+           for every worker. The workers run until the context is closed."""
+        with self._executorlock:
+            if self._executor is None: self._executor = Executor(workers)
+            executor = self._executor
+            executor.workers = max(executor.workers, workers)
+        pool = getattr(self.http.handler, "pool", None)
+        if pool is not None: pool.maxsize = max(pool.maxsize, executor.workers)
+        return executor
 
     def get(self, path, **kwargs):
         """Issue a GET request to the given path."""
-        return self.http.get(self.url(path), self._headers(), **kwargs)
+        return self._call("GET", self.http.get, self.url(path), **kwargs)
+
+    def instrument(self, listener):
+        """Call listener with a timing record for every request issued by
+           the context, see HttpLib.instrument."""
+        self.http.instrument(listener)
+        return listener
 
+    def map(self, method, paths, concurrency=DEFAULT_WORKERS, **kwargs):
+        """Issue a request with the given method and kwargs to each of the
+           given paths concurrently, see batch."""
+        requests = [(method, path, kwargs) for path in paths]
+        return self.batch(requests, concurrency)
+
+    # kwargs: body, ...
     def post(self, path, **kwargs):
-        """Issue a POST request to the given path."""
-        return self.http.post(self.url(path), self._headers(), **kwargs)
+        """Issue a POST request to the given path. If a body is given (a
+           string, file or iterable of strings) it is sent as the request 
+           body and the remaining kwargs as query arguments, see 
+           HttpLib.post."""
+        return self._call("POST", self.http.post, self.url(path), **kwargs)
 
     def request(self, path, message):
-        """Issue the given HTTP request message to the given endpoint."""
-        return self.http.request(
-            self.url(path), {
-                'method': message.get("method", "GET"),
-                'headers': message.get("headers", []) + self._headers(),
-                'body': message.get("body", "")})
+        """Issue the given HTTP request message to the given endpoint. The 
+           message body may be a string, a file or an iterable of strings,
+           which is streamed to the server."""
+        method = message.get("method", "GET")
+        def request(url, headers, body):
+            return self.http.request(url, {
+                'method': method,
+                'headers': message.get("headers", []) + headers,
+                'body': body})
+        return self._call(
+            method, request, self.url(path), body=message.get("body", ""))
 
     def login(self):
         """Issue a Splunk login request using the context's credentials and
-           store the session token for use on subsequent requests."""
+           store the session token for use on subsequent requests. If the
+           context has a token cache holding a token for its credentials, 
+           that token is used instead and only replaced by a login request
+           once the service rejects it."""
+        if self.tokencache is not None:
+            key = TokenCache.key(
+                self.host, self.port, self.username, self.namespace)
+            token = self.tokencache.get(key)
+            if token is not None and token != self.token:
+                self.token = self._cachedtoken = token
+                return self
         response = self.http.post(
             self.url("/services/auth/login"),
             username=self.username, 
@@ -95,6 +311,8 @@ class Context:
         body = response.body.read()
         session = XML(body).findtext("./sessionKey")
         self.token = "Splunk %s" % session
+        if self.tokencache is not None:
+            self.tokencache.set(key, self.token)
         return self
 
     def logout(self):
@@ -123,6 +341,63 @@ class Context:
         """Converts the given path or path fragment into a complete URL."""
         return self.prefix + self.fullpath(path)
 
+class AsyncContext(object):
+    """A binding context whose requests run on the bounded pool of worker
+       threads of the underlying context, see Context.executor. The request
+       methods return a Future for the response instead of the response
+       itself, other attributes are those of the underlying (synchronous)
+       context."""
+
+    # The class of the underlying context
+    contextclass = Context
+
+    # kwargs: scheme, host, port, username, password, namespace
+    def __init__(self, handler=None, workers=DEFAULT_WORKERS, **kwargs):
+        self.context = self.contextclass(handler=handler, **kwargs)
+        self.executor = self.context.executor(workers)
+
+    def __getattr__(self, name):
+        return getattr(self.context, name)
+
+    def close(self):
+        """Shut down the worker threads."""
+        self.context.close()
+
+    # Submit the given request, the kwargs are the request's query arguments
+    # and so are not passed through submit, whose own arguments they might
+    # clash with.
+    def _submit(self, func, path, kwargs):
+        return self.submit(lambda: func(path, **kwargs))
+
+    def delete(self, path, **kwargs):
+        """Issue a DELETE request, returns a Future for the response."""
+        return self._submit(self.context.delete, path, kwargs)
+
+    def get(self, path, **kwargs):
+        """Issue a GET request, returns a Future for the response."""
+        return self._submit(self.context.get, path, kwargs)
+
+    def login(self):
+        """Log in, returns a Future whose result is this context."""
+        def login():
+            self.context.login()
+            return self
+        return self.submit(login)
+
+    def post(self, path, **kwargs):
+        """Issue a POST request, returns a Future for the response."""
+        return self._submit(self.context.post, path, kwargs)
+
+    def request(self, path, message):
+        """Issue the given request message, returns a Future for the 
+           response."""
+        return self.submit(self.context.request, path, message)
+
+    def submit(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on the context's workers and return 
+           its Future."""
+        return self.executor.submit(func, *args, **kwargs)
+
 # kwargs: scheme, host, port, username, password, namespace
 def connect(**kwargs):
     """Establishes an authenticated context with the given host."""
@@ -182,18 +457,30 @@ def encode(**kwargs):
             items.append((key, value))
     return urllib.urlencode(items)
 
-# Crack the given url into (scheme, host, port, path)
-def spliturl(url):
-    scheme, part = url.split(':', 1)
-    host, path = urllib.splithost(part)
-    host, port = urllib.splitnport(host, 80)
-    return scheme, host, port, path
+# Answers if the given request handler (a function or other callable)
+# accepts the 'observe' kwarg, explicitly or as part of **kwargs.
+def _observable(handler):
+    func = handler
+    if not (inspect.isfunction(func) or inspect.ismethod(func)):
+        func = getattr(func, "__call__", None)
+    try:
+        args, _, keywords, _ = inspect.getargspec(func)
+    except TypeError: # Not a Python function, eg: a builtin
+        return False
+    return keywords is not None or "observe" in args
 
 # Given an HTTP request handler, this wrapper objects provides a related
 # family of convenience methods built using that handler.
 class HttpLib(object):    
-    def __init__(self, custom_handler=None):
+    def __init__(self, custom_handler=None, retry=None):
         self.handler = handler() if custom_handler is None else custom_handler
+        self.retry = retry # Optional RetryPolicy
+        self.listeners = []
+        self._observable = _observable(self.handler)
+
+    # Pass a timing record to each listener
+    def _emit(self, timing):
+        for listener in self.listeners: listener(timing)
 
     def delete(self, url, headers=None, **kwargs):
         if headers is None: headers = []
@@ -211,36 +498,185 @@ class HttpLib(object):
             url = url + '?' + encode(**kwargs)
         return self.request(url, { 'method': "GET", 'headers': headers })
 
+    def instrument(self, listener):
+        """Register listener to be called with a timing record once each
+           request's response body has been read, with the fields: method, 
+           url, path (templated, see template), status, sent & received 
+           (bytes), reused (connection), connect, tls, ttfb, body and total
+           (seconds). Timings are only collected by handlers that accept the
+           'observe' kwarg, such as the default handler."""
+        self.listeners.append(listener)
+        return listener
+
+    # kwargs: body, ...
     def post(self, url, headers=None, **kwargs):
         if headers is None: headers = []
-        headers.append(("Content-Type", "application/x-www-form-urlencoded")),
+        body = kwargs.pop("body", None)
+        if body is None:
+            headers.append(
+                ("Content-Type", "application/x-www-form-urlencoded"))
+            body = encode(**kwargs)
+        elif kwargs:
+            url = url + '?' + encode(**kwargs)
         message = {
             'method': "POST",
             'headers': headers,
-            'body': encode(**kwargs)
+            'body': body
         }
         return self.request(url, message)
 
+    # Requests with a streamed body are sent once, outside any retry policy
     def request(self, url, headers=None, **kwargs):
+        if self.retry is None or not replayable(headers.get("body", None)):
+            return self._request(url, headers, **kwargs)
+        method = headers.get("method", "GET")
+        return self.retry.call(
+            method, url, self._request, url, headers, **kwargs)
+
+    def _request(self, url, headers=None, **kwargs):
+        if self.listeners and self._observable:
+            kwargs['observe'] = self._emit
         response = self.handler(url, headers, **kwargs)
         response = record(response)
         if 400 <= response.status:
             raise HTTPError(response) 
         return response
 
-# Converts an httplib response into a file-like object.
+# Converts an httplib response into a file-like object. If a release
+# callback is given, it is called once the body has been read to the end
+# (or the reader is closed) so the underlying connection can be reused. If
+# a content encoding is given, the body is decompressed as it is read.
 class ResponseReader:
-    def __init__(self, response):
+    def __init__(self, response, release=None, encoding=None):
         self._response = response
+        self._release = release
+        self._decoder = _decoder(encoding)
+        self._tail = "" # Compressed input not yet decompressed
+        self._flushed = False
+        self.received = 0 # Raw bytes read from the response
 
     def __str__(self):
         return self.read()
 
-    def read(self, size = None):
-        return self._response.read(size)
+    def _done(self, reuse):
+        release = self._release
+        if release is None: return
+        self._release = None
+        release(reuse, self.received)
+
+    # Read raw (possibly compressed) bytes from the response
+    def _read(self, size = None):
+        if size is None:
+            data = self._response.read()
+        else:
+            data = self._response.read(size)
+        self.received += len(data)
+        if self._release is not None and self._response.isclosed():
+            self._done(True)
+        return data
+
+    def close(self):
+        """Close the response, discarding any unread body."""
+        if self._release is not None:
+            self._done(self._response.isclosed())
+        self._response.close()
 
-# The default HTTP request handler.
-def handler(key_file=None, cert_file=None, timeout=None):
+    def read(self, size = None):
+        decoder = self._decoder
+        if decoder is None: 
+            return self._read(size)
+        if self._flushed: 
+            return ""
+        if size is None:
+            data = decoder.decompress(self._tail + self._read())
+            self._flushed = True
+            return data + decoder.flush()
+        # Decompress no more than size bytes at a time, any compressed 
+        # input left over is kept for the next read.
+        chunks = []
+        count = 0
+        while count < size:
+            data = self._tail
+            if len(data) == 0: 
+                data = self._read(DECODE_SIZE)
+            if len(data) == 0:
+                self._flushed = True
+                chunks.append(decoder.flush())
+                break
+            chunk = decoder.decompress(data, size - count)
+            self._tail = decoder.unconsumed_tail
+            chunks.append(chunk)
+            count += len(chunk)
+        return "".join(chunks)
+
+# Returns a streaming decompressor for the given content encoding, or None
+# if the content is not encoded.
+def _decoder(encoding):
+    if encoding is None: return None
+    encoding = encoding.strip().lower()
+    if encoding in ["", "identity"]: return None
+    if encoding == "gzip": wbits = 16 + zlib.MAX_WBITS
+    elif encoding == "deflate": wbits = zlib.MAX_WBITS
+    else: raise ValueError("unsupported content encoding: %s" % encoding)
+    return zlib.decompressobj(wbits)
+
+# Answers if the given request body can be sent more than once, ie: it is
+# a string rather than a stream (file or iterable).
+def replayable(body):
+    return body is None or isinstance(body, basestring)
+
+# Returns the number of bytes left in the given request body, or None if 
+# unknown, ie: the body is an iterable or a stream other than a regular file.
+def _length(body):
+    if isinstance(body, basestring): return len(body)
+    try:
+        info = os.fstat(body.fileno())
+        if not stat.S_ISREG(info.st_mode): return None
+        return info.st_size - body.tell()
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+
+# Iterate over the given request body (string, file or iterable) in chunks,
+# framed for chunked transfer encoding if requested. Empty chunks are 
+# skipped since they would end a chunked body.
+def _chunks(body, chunked):
+    if isinstance(body, basestring):
+        chunks = [body]
+    elif hasattr(body, "read"):
+        chunks = iter(lambda: body.read(CHUNK_SIZE), "")
+    else:
+        chunks = body
+    for chunk in chunks:
+        if not chunk: continue
+        if chunked: chunk = "%x\r\n%s\r\n" % (len(chunk), chunk)
+        yield chunk
+    if chunked: yield "0\r\n\r\n"
+
+# Connect the given (new) connection, returning the durations of the TCP
+# connect and of the TLS handshake, if any.
+def _open(connection):
+    start = time()
+    httplib.HTTPConnection.connect(connection)
+    connected = time()
+    if isinstance(connection, httplib.HTTPSConnection):
+        context = getattr(connection, "_context", None)
+        if context is not None:
+            hostname = connection._tunnel_host or connection.host
+            connection.sock = context.wrap_socket(
+                connection.sock, server_hostname=hostname)
+        else:
+            connection.sock = ssl.wrap_socket(
+                connection.sock, connection.key_file, connection.cert_file)
+    return connected - start, time() - connected
+
+# The default HTTP request handler. Connections are kept alive and reused
+# across requests via a ConnectionPool, which may be shared by passing
+# the same handler to several contexts. A request that fails because the
+# server dropped its pooled connection is retried once on a new connection,
+# but only if its method is idempotent (see IDEMPOTENT_METHODS) and its
+# body can be sent again, since the server may already have acted on it.
+def handler(key_file=None, cert_file=None, timeout=None, 
+            maxsize=DEFAULT_POOLSIZE, idletime=DEFAULT_IDLETIME):
     """Creates an HTTP request handler parameterized with the given args."""
 
     def connect(scheme, host, port):
@@ -254,33 +690,112 @@ def handler(key_file=None, cert_file=None, timeout=None):
             return httplib.HTTPSConnection(host, port, **kwargs)
         raise ValueError("unsupported scheme: %s" % scheme)
 
+    pool = ConnectionPool(connect, maxsize, idletime)
+
+    # Send the request and read the response head, connecting first if
+    # needed and recording connect & TLS handshake durations in timings.
+    # A streamed body is sent chunk by chunk, counting the bytes sent.
+    def send(connection, method, path, body, head, timings):
+        try:
+            if connection.sock is None:
+                timings['connect'], timings['tls'] = _open(connection)
+            connection.putrequest(method, path, 
+                skip_host=True, skip_accept_encoding=True)
+            for key, value in head.iteritems():
+                connection.putheader(key, value)
+            if isinstance(body, basestring):
+                connection.endheaders(body)
+                timings['sent'] = len(body)
+            else:
+                connection.endheaders()
+                chunked = head.get("Transfer-Encoding", None) == "chunked"
+                for chunk in _chunks(body, chunked):
+                    connection.send(chunk)
+                    timings['sent'] += len(chunk)
+            return connection.getresponse()
+        except:
+            connection.close()
+            raise
+
+    # kwargs: observe
     def request(url, message, **kwargs):
+        observe = kwargs.get("observe", None)
         scheme, host, port, path = spliturl(url)
         body = message.get("body", "")
+        if body is None: body = ""
         head = { 
-            "Content-Length": str(len(body)),
             "Host": host,
             "User-Agent": "splunk-sdk-python/0.1",
             "Accept": "*/*",
+            "Accept-Encoding": "gzip",
         } # defaults
+        length = _length(body)
+        if length is None:
+            head["Transfer-Encoding"] = "chunked"
+        else:
+            head["Content-Length"] = str(length)
         for key, value in message["headers"]: 
             head[key] = value
         method = message.get("method", "GET")
 
-        connection = connect(scheme, host, port)
+        timings = { 'connect': 0.0, 'tls': 0.0, 'sent': 0 }
+        start = time()
+        connection, reused = pool.acquire(scheme, host, port)
         try:
-            connection.request(method, path, body, head)
-            if timeout is not None: 
-                connection.sock.settimeout(timeout)
-            response = connection.getresponse()
-        finally:
-            connection.close()
+            response = send(connection, method, path, body, head, timings)
+        except (socket.error, httplib.BadStatusLine):
+            # The server dropped the idle connection under us, so retry
+            # once on a fresh connection. The request may have reached the
+            # server before the connection dropped, so only idempotent
+            # requests are retried, and never those with a streamed body,
+            # since a chunk may have been read from it before the send
+            # failed, even if nothing was sent.
+            if not reused or method not in IDEMPOTENT_METHODS: raise
+            if not replayable(body): raise
+            connection = pool.connect(scheme, host, port)
+            reused = False
+            response = send(connection, method, path, body, head, timings)
+        headtime = time()
+
+        def release(reuse, received):
+            if reuse and not response.will_close:
+                pool.release(scheme, host, port, connection)
+            else:
+                connection.close()
+            if observe is None: return
+            end = time()
+            sent = timings['sent'] + \
+                len("%s %s HTTP/1.1\r\n\r\n" % (method, path))
+            for key, value in head.iteritems(): 
+                sent += len(key) + len(value) + 4
+            observe(record({
+                'method': method,
+                'url': url,
+                'path': template(path),
+                'status': response.status,
+                'sent': sent,
+                'received': received,
+                'reused': reused,
+                'connect': timings['connect'],
+                'tls': timings['tls'],
+                'ttfb': headtime - start - timings['connect'] - timings['tls'],
+                'body': end - headtime,
+                'total': end - start,
+            }))
+
+        content = response
+        if response.length is not None and response.length <= PRELOAD_SIZE:
+            content = StringIO(ResponseReader(response, release).read())
+            release = None
+        encoding = response.getheader("content-encoding")
+        reader = ResponseReader(content, release, encoding)
 
         return {
             "status": response.status, 
             "reason": response.reason,
             "headers": response.getheaders(),
-            "body": ResponseReader(response),
+            "body": reader,
         }
 
+    request.pool = pool
     return request
@@ -16,11 +16,18 @@
 # The purpose of this module is to provide a friendlier domain interface to 
 # various Splunk endpoints. The approach here is to leverage the binding
 # layer to capture endpoint context and provide objects and methods that
-# offer simplified access their corresponding endpoints. The design avoids
-# caching resource state. From the perspective of this module, the 'policy'
-# for caching resource state belongs in the application or a higher level
-# framework, and its the purpose of this module to provide simplified
-# access to that resource state.
+# offer simplified access their corresponding endpoints.
+#
+# Resource state is cached only briefly. Item access on an entity or job
+# (eg: entity['disabled']) is served from a snapshot of its state, taken by
+# the last read, refresh or collection listing, for up to the service's
+# staleness seconds (DEFAULT_STALENESS, 1 second) before it is refetched, so
+# a property may lag a change made elsewhere by that long. Reads always
+# fetch, updates made through an entity drop its snapshot, and passing
+# staleness=0 to the Service refetches on every access. Collection
+# listings are cached likewise for listingttl seconds, which is off (0) by
+# default. Any longer lived caching policy belongs in the application or a
+# higher level framework.
 #
 # A side note, the objects below that provide helper methods for updating eg:
 # Entity state, are written so that they may be used in a fluent style.
@@ -35,15 +42,23 @@
 #     collection. In Splunk collections, name and key are frequently the same
 #     but not always (eg: inputs).
 
-from time import sleep
-from urllib import urlencode, quote_plus
+from collections import deque
+from itertools import islice
+import sys
+import threading
+from time import sleep, time
+from urllib import urlencode, quote
 from urlparse import urlparse
 
-from splunk.binding import Context, HTTPError
+from splunk.binding import AsyncContext, Context, HTTPError
+from splunk.binding import DEFAULT_WORKERS, Future
 import splunk.data as data
 from splunk.data import record
+from splunk.ingest import BatchSubmitter, StreamWriter
+from splunk.results import ResultsReader, RESULT
 
 __all__ = [
+    "AsyncService",
     "connect",
     "Service"
 ]
@@ -67,9 +82,16 @@ XNAME_CONTENT = XNAMEF_ATOM % "content"
 
 MATCH_ENTRY_CONTENT = "%s/%s/*" % (XNAME_ENTRY, XNAME_CONTENT)
 
+DEFAULT_STALENESS = 1 # Seconds an entity's state snapshot is served for
+
+# Constructs the path of the named member of the collection at the given
+# path, quoting the name
+def _path_item(path, name):
+    return path + quote(name, safe="")
+
 # Constructs a path from the given conf & stanza
 def _path_stanza(conf, stanza):
-    return PATH_STANZA % (conf, quote_plus(stanza))
+    return PATH_STANZA % (conf, quote(stanza, safe=""))
 
 # kwargs: scheme, host, port, username, password, namespace
 def connect(**kwargs):
@@ -80,20 +102,36 @@ def connect(**kwargs):
 def load(response, match=None):
     return data.load(response.body.read(), match)
 
+# Incrementally load the given response, see splunk.data.iterload. The
+# response is closed once done with, even if the caller stops early.
+def iterload(response, match):
+    try:
+        for item in data.iterload(response.body, match): yield item
+    finally:
+        response.body.close()
+
 class Service(Context):
     """The Splunk service."""
+    # kwargs: listingttl, staleness, see splunk.binding.Context for the rest
     def __init__(self, **kwargs):
         Context.__init__(self, **kwargs)
+        # Collection listings are cached for listingttl seconds, if set
+        self.listingttl = kwargs.get("listingttl", 0)
+        self._listings = {} # path => (expires, keys)
+        # Entity properties are served from a state snapshot for up to
+        # staleness seconds before it is refetched, see Entity.refresh
+        self.staleness = kwargs.get("staleness", DEFAULT_STALENESS)
 
     @property
     def apps(self):
         """Return a collection of applications."""
         return Collection(self, PATH_APPS, "apps",
             item=lambda service, name: 
-                Entity(service, PATH_APPS + name, name),
+                Entity(service, _path_item(PATH_APPS, name), name),
             ctor=lambda service, name, **kwargs:
                 service.post(PATH_APPS, name=name, **kwargs),
-            dtor=lambda service, name: service.delete(PATH_APPS + name))
+            dtor=lambda service, name:
+                service.delete(_path_item(PATH_APPS, name)))
 
     @property
     def confs(self):
@@ -143,7 +181,7 @@ class Service(Context):
         """Returns a collection of logging categories."""
         return Collection(self, PATH_LOGGER, "loggers",
             item=lambda service, name: 
-                Entity(service, PATH_LOGGER + name, name))
+                Entity(service, _path_item(PATH_LOGGER, name), name))
 
     @property
     def messages(self):
@@ -153,7 +191,7 @@ class Service(Context):
             ctor=lambda service, name, **kwargs:
                 service.post(PATH_MESSAGES, name=name, **kwargs), # value
             dtor=lambda service, name:
-                service.delete(PATH_MESSAGES + name))
+                service.delete(_path_item(PATH_MESSAGES, name)))
 
     # kwargs: enable_lookups, reload_macros, parse_only, output_mode
     def parse(self, query, **kwargs):
@@ -168,10 +206,11 @@ class Service(Context):
     def roles(self):
         return Collection(self, PATH_ROLES, "roles",
             item=lambda service, name: 
-                Entity(service, PATH_ROLES + name, name),
+                Entity(service, _path_item(PATH_ROLES, name), name),
             ctor=lambda service, name, **kwargs:
                 service.post(PATH_ROLES, name=name, **kwargs),
-            dtor=lambda service, name: service.delete(PATH_ROLES + name))
+            dtor=lambda service, name:
+                service.delete(_path_item(PATH_ROLES, name)))
 
     @property
     def settings(self):
@@ -182,10 +221,11 @@ class Service(Context):
     def users(self):
         return Collection(self, PATH_USERS, "users",
             item=lambda service, name: 
-                Entity(service, PATH_USERS + name, name),
+                Entity(service, _path_item(PATH_USERS, name), name),
             ctor=lambda service, name, **kwargs:
                 service.post(PATH_USERS, name=name, **kwargs),
-            dtor=lambda service, name: service.delete(PATH_USERS + name))
+            dtor=lambda service, name:
+                service.delete(_path_item(PATH_USERS, name)))
 
 class Endpoint:
     """The base class for all client layer endpoints."""
@@ -224,21 +264,64 @@ class Collection(Endpoint):
     def __iter__(self):
         # Don't invoke __getitem__ below, we don't need the extra round-trip
         # to validate that the key exists, because we just it from the list.
-        for name in self.list(): yield self.item(self.service, name)
+        for item in self.items(): yield item
+
+    # Answers the cached listing of collection keys, if still fresh
+    def _cached(self):
+        cached = self.service._listings.get(self.path, None)
+        if cached is None or cached[0] < time(): return None
+        return cached[1]
 
     def contains(self, name):
-        return name in self.list()
+        """Answers if the collection has a member with the given key, by
+           requesting the member rather than listing the collection."""
+        keys = self._cached()
+        if keys is not None: return name in keys
+        if self.item is None: return name in self.list()
+        try:
+            response = self.service.get(self.item(self.service, name).path)
+        except HTTPError as e:
+            if e.status == 404: return False
+            raise
+        response.body.read() # Drain, so the connection can be reused
+        return True
 
     def create(self, name, **kwargs):
         if self.ctor is None: raise NotSupportedError
         self.ctor(self.service, name, **kwargs)
+        self.invalidate()
         return self[name]
 
     def delete(self, name):
         if self.dtor is None: raise NotSupportedError
         self.dtor(self.service, name)
+        self.invalidate()
         return self
 
+    def invalidate(self):
+        """Discard the cached listing of the collection, if any."""
+        self.service._listings.pop(self.path, None)
+        return self
+
+    def items(self):
+        """Returns a list of the collection's members, each populated with
+           its state from the single listing request (see Entity.state),
+           rather than making a request per member."""
+        response = self.get(count=-1)
+        return [self._load_item(item.entry)
+                for item in iterload(response, XNAME_ENTRY)]
+
+    # Answers the key of the member described by the given listing entry
+    def _key(self, entry):
+        return entry.title
+
+    # Construct the member described by the given listing entry, populated
+    # with the entry's content if the member holds state.
+    def _load_item(self, entry):
+        item = self.item(self.service, self._key(entry))
+        if isinstance(item, StatefulEndpoint): item._snapshot(entry.content)
+        return item
+
     def itemmeta(self):
         """Returns metadata for members of the collection."""
         response = self.get("/_new")
@@ -249,21 +332,25 @@ class Collection(Endpoint):
         })
 
     def list(self):
-        """Returns a list of collection keys."""
-        response = self.get(count=-1)
-        entry = load(response).feed.get('entry', None)
-        if entry is None: return []
-        if not isinstance(entry, list): 
-            entry = [entry]
-        return [item.title for item in entry]
+        """Returns a list of collection keys, from the service's listing
+           cache if enabled (see Service listingttl) and still fresh."""
+        keys = self._cached()
+        if keys is None:
+            response = self.get(count=-1)
+            keys = [self._key(item.entry)
+                    for item in iterload(response, XNAME_ENTRY)]
+            ttl = self.service.listingttl
+            if ttl > 0:
+                self.service._listings[self.path] = (time() + ttl, keys)
+        return list(keys)
 
 def _filter_content(content, *args):
     if len(args) > 0: # We have filter args
         result = record({})
         for key in args: result[key] = content[key]
     else:
-        # Eliminate some noise by default
-        result = content
+        # Eliminate some noise by default, leaving the given content as is
+        result = record(content)
         if result.has_key('eai:acl'):
             del result['eai:acl']
         if result.has_key('eai:attributes'):
@@ -272,31 +359,70 @@ def _filter_content(content, *args):
             del result['type']
     return result
 
-class Entity(Endpoint):
-    """A generic implementation of the Splunk 'entity' protocol."""
-    def __init__(self, service, path, name=None):
+class StatefulEndpoint(Endpoint):
+    """The base class for endpoints whose properties are served from a
+       snapshot of their state, ie: entities and jobs."""
+    def __init__(self, service, path, state=None):
         Endpoint.__init__(self, service, path)
-        if name is not None: self.name = name
-        self.disable = lambda: self.post("disable")
-        self.enable = lambda: self.post("enable")
-        self.reload = lambda: self.post("_reload")
+        self._snapshot(state)
 
     def __call__(self):
         return self.read()
 
+    # Served from the state snapshot unless it is stale, see refresh
     def __getitem__(self, key):
-        return self.read()[key]
+        if self._stale(): self.refresh()
+        return self.state[key]
+
+    # Loads the endpoint's content from the given response
+    def _load(self, response):
+        return load(response, MATCH_ENTRY_CONTENT)
+
+    # Record the given content as the state snapshot, ie: the content as of
+    # the last read or listing, filtered the way read filters it. Returns
+    # the unfiltered content.
+    def _snapshot(self, content):
+        self.state = None if content is None else _filter_content(content)
+        self._stamp = time()
+        return content
+
+    # Answers if the state snapshot is missing or older than the service's
+    # staleness allows.
+    def _stale(self):
+        if self.state is None: return True
+        return time() - self._stamp >= self.service.staleness
 
-    def __setitem__(self, key, value):
-        self.update(**{ key: value })
+    def post(self, relpath="", **kwargs):
+        response = Endpoint.post(self, relpath, **kwargs)
+        self.state = None # The snapshot no longer reflects the endpoint
+        return response
 
     def read(self, *args):
-        """Read and return the current entity value, optionally returning
-           only the requested fields, if specified."""
-        response = self.get()
-        content = load(response, MATCH_ENTRY_CONTENT)
+        """Read and return the current value, optionally returning only the
+           requested fields, if specified. The state snapshot is refreshed
+           as well."""
+        content = self._snapshot(self._load(self.get()))
         return _filter_content(content, *args)
 
+    def refresh(self):
+        """Refetch the state snapshot, which item access (eg:
+           entity['disabled']) is otherwise served from until it is older
+           than the service's staleness."""
+        self.read()
+        return self
+
+class Entity(StatefulEndpoint):
+    """A generic implementation of the Splunk 'entity' protocol."""
+    def __init__(self, service, path, name=None, state=None):
+        StatefulEndpoint.__init__(self, service, path, state)
+        if name is not None: self.name = name
+        self.disable = lambda: self.post("disable")
+        self.enable = lambda: self.post("enable")
+        self.reload = lambda: self.post("_reload")
+
+    def __setitem__(self, key, value):
+        self.update(**{ key: value })
+
     def readmeta(self):
         """Return the entity's metadata."""
         return self.read('eai:acl', 'eai:attributes')
@@ -314,28 +440,22 @@ class Conf(Entity):
 class Index(Entity):
     """Index class access to specific operations."""
     def __init__(self, service, name):
-        Entity.__init__(self, service, PATH_INDEXES + name, name)
+        Entity.__init__(self, service, _path_item(PATH_INDEXES, name), name)
         self.roll_hot_buckets = lambda: self.post("roll-hot-buckets")
 
-    def attach(self, host=None, source=None, sourcetype=None):
-        """Opens a stream for writing events to the index."""
+    # kwargs: bufsize, linger, maxbuffer, retries
+    def attach(self, host=None, source=None, sourcetype=None, **kwargs):
+        """Opens a stream for writing events to the index, returns a
+           buffered, reconnecting splunk.ingest.StreamWriter."""
         args = { 'index': self.name }
         if host is not None: args['host'] = host
         if source is not None: args['source'] = source
         if sourcetype is not None: args['sourcetype'] = sourcetype
         path = "receivers/stream?%s" % urlencode(args)
 
-        # Since we need to stream to the index connection, we have to keep
-        # the connection open and use the Splunk extension headers to note
-        # the input mode
-        cn = self.service.connect()
-        cn.write("POST %s HTTP/1.1\r\n" % self.service.fullpath(path))
-        cn.write("Host: %s:%s\r\n" % (self.service.host, self.service.port))
-        cn.write("Accept-Encoding: identity\r\n")
-        cn.write("Authorization: %s\r\n" % self.service.token)
-        cn.write("X-Splunk-Input-Mode: Streaming\r\n")
-        cn.write("\r\n")
-        return cn
+        # Since we need to stream to the index connection, the writer keeps
+        # the connection open (reopening it if dropped)
+        return StreamWriter(self.service, path, **kwargs)
 
     def clean(self):
         """Delete the contents of the index."""
@@ -344,11 +464,13 @@ class Index(Entity):
         self.roll_hot_buckets()
         while True: # Wait until event count goes to zero
             sleep(1)
-            if self['totalEventCount'] == '0': break
+            if self.refresh()['totalEventCount'] == '0': break
         self.update(**saved)
 
     def submit(self, event, host=None, source=None, sourcetype=None):
-        """Submits an event to the index via HTTP POST."""
+        """Submits an event to the index via HTTP POST. The event may be a
+           string, or a file or iterable of strings whose content is 
+           streamed to the server."""
         args = { 'index': self.name }
         if host is not None: args['host'] = host
         if source is not None: args['source'] = source
@@ -362,6 +484,21 @@ class Index(Entity):
         message = { 'method': "POST", 'body': event }
         response = self.service.request(path, message)
 
+    # kwargs: batchsize, linger, concurrency, separator
+    def submit_many(self, events, host=None, source=None, sourcetype=None,
+                    **kwargs):
+        """Submits the given events to the index, joined one per line into
+           as few POSTs as batchsize allows with several in flight at a
+           time, see splunk.ingest.BatchSubmitter. Returns the throughput
+           stats."""
+        submitter = BatchSubmitter(self.service, **kwargs)
+        try:
+            for event in events:
+                submitter.submit(event, self.name, host, source, sourcetype)
+        finally:
+            submitter.close()
+        return submitter.stats()
+
     # kwargs: host, host_regex, host_segment, rename-source, sourcetype
     def upload(self, filename, **kwargs):
         """Uploads a file to the index using the 'oneshot' input. The file
@@ -468,21 +605,18 @@ class Inputs(Endpoint):
     def refresh(self):
         """Refreshes the internal directory of entities and entity metadata."""
         self._infos = {}
-        for kind in self.kinds:
-
-            response = None
-            try:
-                response = self.service.get(self.kindpath(kind), count=-1)
-            except HTTPError as e:
-                if e.status == 404: 
-                    continue # Nothing of this kind
-                else: 
-                    raise
-                
-            entry = load(response).feed.get('entry', None)
-            if entry is None: continue
-            if not isinstance(entry, list): entry = [entry]
-            for item in entry:
+        kinds = self.kinds
+        futures = self.service._futures(
+            [("GET", self.kindpath(kind), { 'count': -1 }) for kind in kinds],
+            DEFAULT_WORKERS)
+        for kind, future in zip(kinds, futures):
+            error = future.exception()
+            if isinstance(error, HTTPError) and error.status == 404:
+                continue # Nothing of this kind
+            response = future.result() # Raises any other error
+
+            for item in iterload(response, XNAME_ENTRY):
+                item = item.entry
                 name = item.title
                 key = self.itemkey(kind, name)
                 path = urlparse(item.id).path
@@ -496,19 +630,98 @@ class Inputs(Endpoint):
                 }
         return self
 
+# Translate the given 'fields' projection kwarg, a list of field names, into
+# the corresponding REST 'f' args so only those fields are returned, see 
+# also ResultsReader's fields.
+def _project(kwargs):
+    fields = kwargs.pop("fields", None)
+    if fields is not None: kwargs['f'] = list(fields)
+    return kwargs
+
+DEFAULT_PAGESIZE = 10000 # Rows per request when paging job results
+
+# Job status is polled every POLL_MIN seconds at first, backing off by a
+# factor of POLL_GROWTH up to every POLL_MAX seconds for long searches.
+POLL_MIN = 0.05
+POLL_MAX = 2
+POLL_GROWTH = 1.5
+
+# Yields the successive delays between job status polls
+def _backoff():
+    delay = POLL_MIN
+    while True:
+        yield delay
+        delay = min(delay*POLL_GROWTH, POLL_MAX)
+
+# Sleep for the given delay, but not past the given deadline (if any),
+# raising RuntimeError once the deadline has passed.
+def _pause(delay, deadline):
+    if deadline is not None:
+        remaining = deadline - time()
+        if remaining <= 0: raise RuntimeError("Timed out waiting for job")
+        delay = min(delay, remaining)
+    sleep(delay)
+
+# Answers if a job with the given content is done or, if states are given,
+# has reached one of the given dispatch states.
+def _reached(content, states):
+    if states is None: return content['isDone'] == '1'
+    return content['dispatchState'] in states
+
 # The Splunk Job is not an enity, but we are able to make the interface look
 # a lot like one.
-class Job(Endpoint): 
+class Job(StatefulEndpoint):
     """Job class access to specific operations."""
     def __init__(self, service, sid):
-        Endpoint.__init__(self, service, PATH_JOBS + sid)
+        StatefulEndpoint.__init__(self, service, PATH_JOBS + sid)
         self.sid = sid
 
-    def __call__(self):
-        return self.read()
-
-    def __getitem__(self, key):
-        return self.read()[key]
+    def _load(self, response):
+        return load(response).entry.content
+
+    # Iterate over the rows of the given job output (eg: self.results),
+    # fetched in offset/count windows of pagesize rows, up to concurrency
+    # windows at a time on the service's shared workers. Each window
+    # is parsed by the worker that fetched it and rows are yielded in order,
+    # so read-ahead is bounded by concurrency windows. The total comes from
+    # the job's countkey (eg: resultCount), so the job should be done. If
+    # the caller stops early, windows not yet fetched are cancelled and
+    # those being read are cut short, closing their response bodies. On one
+    # of the service's workers, windows are fetched one at a time inline.
+    def _pages(self, fetch, countkey, pagesize, concurrency, kwargs):
+        fields = kwargs.get("fields", None)
+        total = int(self.refresh()[countkey])
+        offsets = iter(xrange(0, total, pagesize))
+        closed = threading.Event() # Set once the caller stops early
+
+        def page(offset):
+            body = fetch(offset=offset, count=pagesize, **kwargs)
+            try:
+                rows = []
+                for kind, value in ResultsReader(body, fields):
+                    if closed.is_set(): break
+                    if kind == RESULT: rows.append(value)
+                return rows
+            finally:
+                body.close()
+
+        executor = self.service.executor(concurrency)
+        if executor.inworker(): # Windows queued behind us might never run
+            for offset in offsets:
+                for row in page(offset): yield row
+            return
+        pending = deque(
+            executor.submit(page, offset)
+            for offset in islice(offsets, concurrency))
+        try:
+            while pending:
+                rows = pending.popleft().result()
+                for offset in islice(offsets, 1):
+                    pending.append(executor.submit(page, offset))
+                for row in rows: yield row
+        finally:
+            closed.set()
+            for future in pending: future.cancel()
 
     def cancel(self):
         self.post("control", action="cancel")
@@ -518,13 +731,32 @@ class Job(Endpoint):
         self.post("control", action="disablepreview")
         return self
 
+    # kwargs: fields, ...
     def events(self, **kwargs):
-        return self.get("events", **kwargs).body
+        return self.get("events", **_project(kwargs)).body
 
     def enable_preview(self):
         self.post("control", action="enablepreview")
         return self
 
+    # kwargs: fields, ...
+    def iterevents(self, pagesize=DEFAULT_PAGESIZE,
+                   concurrency=DEFAULT_WORKERS, **kwargs):
+        """Iterates over the job's events, fetching several pages of
+           pagesize events concurrently, see iterresults."""
+        return self._pages(
+            self.events, "eventCount", pagesize, concurrency, kwargs)
+
+    # kwargs: fields, ...
+    def iterresults(self, pagesize=DEFAULT_PAGESIZE,
+                    concurrency=DEFAULT_WORKERS, **kwargs):
+        """Iterates over the rows of a completed job's results, fetching
+           up to concurrency pages of pagesize results at a time so that
+           download throughput scales with the number of connections. Rows
+           are yielded in order."""
+        return self._pages(
+            self.results, "resultCount", pagesize, concurrency, kwargs)
+
     def finalize(self):
         self.post("control", action="finalize")
         return self
@@ -533,16 +765,13 @@ class Job(Endpoint):
         self.post("control", action="pause")
         return self
 
+    # kwargs: fields, ...
     def preview(self, **kwargs):
-        return self.get("results_preview", **kwargs).body
-
-    def read(self, *args):
-        response = self.get()
-        content = load(response).entry.content
-        return _filter_content(content, *args)
+        return self.get("results_preview", **_project(kwargs)).body
 
+    # kwargs: fields, ...
     def results(self, **kwargs):
-        return self.get("results", **kwargs).body
+        return self.get("results", **_project(kwargs)).body
 
     def searchlog(self, **kwargs):
         return self.get("search.log", **kwargs).body
@@ -568,6 +797,16 @@ class Job(Endpoint):
         self.post("control", action="unpause")
         return self
 
+    def wait(self, timeout=None, states=None):
+        """Wait for the job to be done or, if given, to reach one of the
+           given dispatch states (eg: ["RUNNING", "DONE"]). Status is polled
+           often at first and less often the longer the search runs. Raises
+           RuntimeError if timeout seconds pass first, returns the job."""
+        deadline = None if timeout is None else time() + timeout
+        for delay in _backoff():
+            if _reached(self.refresh().state, states): return self
+            _pause(delay, deadline)
+
 class Jobs(Collection):
     """A collection of search jobs."""
     def __init__(self, service):
@@ -581,18 +820,47 @@ class Jobs(Collection):
             return response.body
 
         sid = load(response).response.sid
+        self.invalidate()
         return Job(self.service, sid)
 
-    def list(self):
-        response = self.get()
-        entry = load(response, MATCH_ENTRY_CONTENT)
-        if entry is None: return []
-        if not isinstance(entry, list): entry = [entry]
-        return [item.sid for item in entry]
+    def _key(self, entry):
+        return entry.content.sid
+
+    def wait_all(self, jobs, timeout=None, states=None):
+        """Wait for all of the given jobs (or sids) to be done or to reach
+           one of the given states, see Job.wait. Each poll is a single
+           listing request, rather than a request per job, which also
+           refreshes each job's state. Raises KeyError if a job is not in
+           the listing, returns the list of jobs."""
+        jobs = [job if isinstance(job, Job) else Job(self.service, job)
+                for job in jobs]
+        pending = dict((job.sid, job) for job in jobs)
+        deadline = None if timeout is None else time() + timeout
+        for delay in _backoff():
+            listed = self._poll(pending.values())
+            for sid in pending:
+                if sid not in listed: raise KeyError, sid
+            for job in pending.values():
+                if _reached(job.state, states): del pending[job.sid]
+            if len(pending) == 0: return jobs
+            _pause(delay, deadline)
+
+    # List the jobs with a single request, refreshing the state of each of
+    # the given jobs, and answer the set of sids listed.
+    def _poll(self, jobs):
+        bysid = {}
+        for job in jobs: bysid.setdefault(job.sid, []).append(job)
+        listed = set()
+        for item in iterload(self.get(count=-1), XNAME_ENTRY):
+            sid = self._key(item.entry)
+            if sid not in bysid: continue
+            listed.add(sid)
+            for job in bysid[sid]: job._snapshot(item.entry.content)
+        return listed
 
 class Message(Entity):
     def __init__(self, service, name):
-        Entity.__init__(self, service, PATH_MESSAGES + name, name)
+        Entity.__init__(self, service, _path_item(PATH_MESSAGES, name), name)
 
     @property
     def value(self):
@@ -600,6 +868,191 @@ class Message(Entity):
         # the name of the message.
         return self[self.name]
 
+# Waits on jobs for an AsyncService. A single thread polls the job listing
+# on behalf of every pending wait, see Jobs.wait_all, rather than each wait
+# tying up one of the service's workers, and resolves the Future of each
+# wait once its job reaches the awaited state.
+class _JobPoller(object):
+    def __init__(self, jobs):
+        self.jobs = jobs # The Jobs collection polled
+        self._waits = [] # (job, states, deadline, future, result)
+        self._added = False # A wait was added since the last poll
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    # Answers the outcome of the given wait given the sids listed by the
+    # last poll, or the error that failed it: a value or exc_info to resolve
+    # the wait's Future with, or None while the wait goes on.
+    def _outcome(self, wait, listed, error, now):
+        job, states, deadline, future, result = wait
+        if error is not None: return error
+        if job.sid not in listed: return (KeyError, KeyError(job.sid), None)
+        if _reached(job.state, states): return result
+        if deadline is not None and now >= deadline:
+            error = RuntimeError("Timed out waiting for job")
+            return (RuntimeError, error, None)
+        return None
+
+    def _run(self):
+        delays = _backoff()
+        while True:
+            with self._cond:
+                while len(self._waits) == 0 and not self._closed:
+                    self._cond.wait()
+                if self._closed: break
+                if self._added: delays = _backoff() # Poll often again
+                self._added = False
+                waits = list(self._waits)
+            listed, error = set(), None
+            try:
+                listed = self.jobs._poll([wait[0] for wait in waits])
+            except Exception:
+                error = sys.exc_info()
+            now = time()
+            done = []
+            for wait in waits:
+                outcome = self._outcome(wait, listed, error, now)
+                if outcome is not None: done.append((wait, outcome))
+            with self._cond:
+                for wait, outcome in done: self._waits.remove(wait)
+            for (job, states, deadline, future, result), outcome in done:
+                if isinstance(outcome, tuple): future.set_exception(outcome)
+                else: future.set_result(outcome)
+            delay = delays.next()
+            with self._cond:
+                for wait in self._waits:
+                    if wait[2] is not None:
+                        delay = max(0, min(delay, wait[2] - now))
+                if not self._added and not self._closed:
+                    self._cond.wait(delay)
+        error = RuntimeError("Service closed")
+        for job, states, deadline, future, result in self._waits:
+            future.set_exception((RuntimeError, error, None))
+        self._waits = []
+
+    def close(self):
+        """Stop polling, failing any pending waits."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def wait(self, job, timeout=None, states=None, result=None):
+        """Wait for the given job to be done or to reach one of the given
+           states, see Job.wait, returns a Future for the given result."""
+        future = Future()
+        deadline = None if timeout is None else time() + timeout
+        with self._cond:
+            if self._closed: raise ValueError("Wait on a closed poller")
+            self._waits.append((job, states, deadline, future, result))
+            self._added = True
+            self._cond.notify_all()
+        return future
+
+class AsyncService(AsyncContext):
+    """A Splunk service whose requests run on a bounded pool of worker 
+       threads and return Futures, see splunk.binding.AsyncContext. Job
+       waits are served by a single poller thread instead."""
+    contextclass = Service
+
+    # kwargs: see Service
+    def __init__(self, handler=None, workers=DEFAULT_WORKERS, **kwargs):
+        AsyncContext.__init__(self, handler, workers, **kwargs)
+        self._poller = None # Serves job waits, see poller
+        self._pollerlock = threading.Lock()
+
+    def close(self):
+        """Stop the job poller and shut down the worker threads."""
+        with self._pollerlock:
+            poller = self._poller
+            self._poller = None
+        if poller is not None: poller.close()
+        AsyncContext.close(self)
+
+    def poller(self):
+        """Returns the poller that serves the service's job waits, created
+           on first use."""
+        with self._pollerlock:
+            if self._poller is None:
+                self._poller = _JobPoller(self.context.jobs)
+            return self._poller
+
+    @property
+    def jobs(self):
+        """Returns the collection of search jobs."""
+        return AsyncJobs(self)
+
+class AsyncJob(object):
+    """A search job whose operations return Futures."""
+    def __init__(self, service, job):
+        self.service = service
+        self.job = job
+        self.sid = job.sid
+
+    # Submit the given job operation, resolving to this object
+    def _control(self, func, *args):
+        def control():
+            func(*args)
+            return self
+        return self.service.submit(control)
+
+    def cancel(self):
+        return self._control(self.job.cancel)
+
+    def events(self, **kwargs):
+        return self.service.submit(self.job.events, **kwargs)
+
+    def finalize(self):
+        return self._control(self.job.finalize)
+
+    def pause(self):
+        return self._control(self.job.pause)
+
+    def preview(self, **kwargs):
+        return self.service.submit(self.job.preview, **kwargs)
+
+    def read(self, *args):
+        return self.service.submit(self.job.read, *args)
+
+    def results(self, **kwargs):
+        return self.service.submit(self.job.results, **kwargs)
+
+    def touch(self):
+        return self._control(self.job.touch)
+
+    def unpause(self):
+        return self._control(self.job.unpause)
+
+    def wait(self, timeout=None, states=None):
+        """Returns a Future that resolves to this object once the job is
+           done or reaches one of the given states, see Job.wait. Waits
+           share the service's job poller rather than taking a worker."""
+        return self.service.poller().wait(self.job, timeout, states, self)
+
+class AsyncJobs(object):
+    """A collection of search jobs whose operations return Futures."""
+    def __init__(self, service):
+        self.service = service
+        self.jobs = service.context.jobs
+
+    def __getitem__(self, sid):
+        return AsyncJob(self.service, Job(self.service.context, sid))
+
+    def create(self, query, **kwargs):
+        """Create a search job, returns a Future for the AsyncJob, or for
+           the results body when exec_mode is 'oneshot'."""
+        def create():
+            result = self.jobs.create(query, **kwargs)
+            if not isinstance(result, Job): return result
+            return AsyncJob(self.service, result)
+        return self.service.submit(create)
+
+    def list(self):
+        return self.service.submit(self.jobs.list)
+
 class SplunkError(Exception): 
     pass
 
@@ -16,8 +16,12 @@
 
 import sys
 from xml.etree.ElementTree import XML
+try:
+    from xml.etree.cElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
 
-__all__ = ["load"]
+__all__ = ["iterload", "load"]
 
 LNAME_DICT = "dict"
 LNAME_ITEM = "item"
@@ -70,6 +74,47 @@ def load(text, match=None):
     if count == 1: return load_root(items[0], nametable)
     return [ load_root(item, nametable) for item in items ]
 
+def iterload(stream, match):
+    """Incrementally load the XML read from the given file-like stream, 
+       yielding the matching sub-elements one at a time as load would 
+       return them. The first step of the match path names the repeating
+       children of the root (eg: ATOM entries) and the rest, if any, is
+       matched within each child. Each child is discarded once loaded, so 
+       memory use is bounded by the largest child rather than the 
+       document."""
+    first, rest = _splitmatch(match)
+    nametable = {
+        'namespaces': [],
+        'names': {}
+    }
+    root = None
+    depth = 0
+    try:
+        for event, element in iterparse(stream, ("start", "end")):
+            if event == "start":
+                if root is None: root = element
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1: continue
+            if first == "*" or element.tag == first:
+                items = [element] if rest is None else element.findall(rest)
+                for item in items: yield load_root(item, nametable)
+            root.clear() # Discard what we have loaded so far
+    except SyntaxError:
+        if root is None: return # Empty document, like load
+        raise
+
+# Split the given match path into its first step and the remaining path,
+# minding the '/' in namespace URIs, eg: "{http://ns}a/b" => "{http://ns}a",
+# "b".
+def _splitmatch(match):
+    start = 0
+    if match.startswith('{'): start = match.index('}')
+    slash = match.find('/', start)
+    if slash == -1: return match, None
+    return match[:slash], match[slash+1:]
+
 # Load the attributes of the given element.
 def load_attrs(element):
     if not hasattrs(element): return None
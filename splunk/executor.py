@@ -0,0 +1,160 @@
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""A bounded pool of worker threads and the Futures of the calls they run,
+   see splunk.binding.AsyncContext."""
+
+import Queue
+import sys
+import threading
+
+from splunk.pool import DEFAULT_POOLSIZE
+
+__all__ = [
+    "Executor",
+    "Future",
+]
+
+DEFAULT_WORKERS = DEFAULT_POOLSIZE # Worker threads per AsyncContext
+
+class Future(object):
+    """The pending result of a call submitted to an Executor."""
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._value = None
+        self._error = None # exc_info of a failed call
+        self._running = False
+        self._cancelled = False
+
+    def _complete(self):
+        self._event.set()
+        with self._lock:
+            callbacks = self._callbacks
+            self._callbacks = None
+        for callback in callbacks: callback(self)
+
+    def add_done_callback(self, callback):
+        """Call the given callback with this future once it is done."""
+        with self._lock:
+            if self._callbacks is not None:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self):
+        """Cancel the call unless it has already started, answers if the
+           call is cancelled. The result of a cancelled call is an error."""
+        with self._lock:
+            if self._running or self._event.is_set(): return self._cancelled
+            self._cancelled = True
+        self.set_exception(
+            (RuntimeError, RuntimeError("Cancelled"), None))
+        return True
+
+    def cancelled(self):
+        """Answers if the call was cancelled before it started."""
+        return self._cancelled
+
+    def done(self):
+        """Answers if the call has completed."""
+        return self._event.is_set()
+
+    def exception(self, timeout=None):
+        """Wait for the call to complete and return the exception it raised,
+           or None if it succeeded."""
+        self.wait(timeout)
+        return None if self._error is None else self._error[1]
+
+    def result(self, timeout=None):
+        """Wait for the call to complete and return its value, re-raising
+           the exception if the call failed."""
+        self.wait(timeout)
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+        return self._value
+
+    def set_exception(self, exc_info):
+        self._error = exc_info
+        self._complete()
+
+    def set_result(self, value):
+        self._value = value
+        self._complete()
+
+    # Marks the call as running, answers False if it was cancelled.
+    def _start(self):
+        with self._lock:
+            if self._cancelled: return False
+            self._running = True
+            return True
+
+    def wait(self, timeout=None):
+        """Wait for the call to complete, raises RuntimeError on timeout."""
+        if not self._event.wait(timeout):
+            raise RuntimeError("Timed out waiting for result")
+        return self
+
+class Executor(object):
+    """A bounded pool of worker threads that run submitted calls, so that
+       many requests can be in flight without a thread per request."""
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.workers = workers
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._local = threading.local() # Marks the worker threads
+
+    def _run(self):
+        self._local.worker = True
+        while True:
+            item = self._queue.get()
+            if item is None: return # Shutdown
+            future, func, args, kwargs = item
+            if not future._start(): continue
+            try:
+                value = func(*args, **kwargs)
+            except:
+                future.set_exception(sys.exc_info())
+            else:
+                future.set_result(value)
+
+    def inworker(self):
+        """Answers if the calling thread is one of the executor's workers. A
+           worker that waits on calls it submits may wait forever, since the
+           calls can be queued behind the worker itself, so callers that fan
+           out work run it inline instead, see Context.batch."""
+        return getattr(self._local, "worker", False)
+
+    def shutdown(self, wait=True):
+        """Stop the worker threads once the pending calls are done."""
+        with self._lock:
+            threads = self._threads
+            self._threads = []
+        for thread in threads: self._queue.put(None)
+        if wait:
+            for thread in threads: thread.join()
+
+    def submit(self, func, *args, **kwargs):
+        """Schedule func(*args, **kwargs) and return its Future."""
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        with self._lock: # Start workers lazily, up to the limit
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        return future
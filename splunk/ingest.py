@@ -0,0 +1,866 @@
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Event ingestion helpers for writing event data to Splunk indexes."""
+
+from datetime import datetime
+import mmap
+from operator import itemgetter
+import os
+import re
+import select
+import socket
+import struct
+import threading
+from time import sleep, time
+
+from splunk.binding import DEFAULT_WORKERS, Executor
+from splunk.data import record
+
+__all__ = [
+    "BatchSubmitter",
+    "EventEncoder",
+    "InputSender",
+    "Spool",
+    "StreamWriter"
+]
+
+PATH_SIMPLE = "receivers/simple"
+
+DEFAULT_BUFSIZE = 64*1024 # Bytes coalesced into each write to the socket
+DEFAULT_LINGER = 0.5 # Seconds buffered data may wait before it is sent
+DEFAULT_MAXBUFFER = 4*1024*1024 # Bytes buffered before writers block
+DEFAULT_RETRIES = 5 # Reconnect attempts before giving up on a write
+DEFAULT_BATCHSIZE = 1024*1024 # Bytes of events joined into one POST body
+DEFAULT_SEGMENTSIZE = 16*1024*1024 # Bytes preallocated per spool segment
+DEFAULT_CONNECTIONS = 2 # Connections per indexer for raw network inputs
+MAX_LAYOUTS = 256 # Field layouts an EventEncoder keeps formats for
+
+# Reconnects back off exponentially from BACKOFF_MIN to BACKOFF_MAX seconds
+BACKOFF_MIN = 0.1
+BACKOFF_MAX = 5
+
+# The event metadata a batch is keyed on
+METADATA = ("index", "host", "source", "sourcetype")
+
+# Characters escaped in encoded field values, and their escapes
+ESCAPES = {'\\': "\\\\", '"': '\\"', '\r': "\\r", '\n': "\\n"}
+_ESCAPED = re.compile(r'[\\"\r\n]')
+
+_ESCAPABLE = "".join(ESCAPES)
+
+# Answers if the given str has nothing to escape, deleting the characters
+# to escape is much quicker than searching for them with _ESCAPED.
+def _clean(text):
+    return len(text.translate(None, _ESCAPABLE)) == len(text)
+
+# Returns the given event data as a str, encoding unicode and copying
+# bytearrays, which the caller may go on to reuse.
+def _data(data):
+    if isinstance(data, unicode): return data.encode("utf-8")
+    if isinstance(data, bytearray): return str(data)
+    return data
+
+# Returns the given field value as escaped text
+def _text(value):
+    if isinstance(value, (list, tuple)):
+        return ",".join(_text(item) for item in value if item is not None)
+    if isinstance(value, dict):
+        raise TypeError("Field values may not be dicts")
+    if isinstance(value, unicode): value = value.encode("utf-8")
+    elif isinstance(value, float): value = repr(value)
+    elif not isinstance(value, str): value = str(value)
+    if _clean(value): return value
+    return _ESCAPED.sub(lambda match: ESCAPES[match.group()], value)
+
+# Returns the given fields, with the given values, encoded as key="value"
+# pairs, converting and escaping each value.
+def _encode(names, values):
+    return " ".join(['%s="%s"' % (name, _text(value))
+                     for name, value in zip(names, values)
+                     if value is not None])
+
+# Returns a function that answers the tuple of the given keys' values in
+# a dict.
+def _getter(keys):
+    if len(keys) == 0: return lambda values: ()
+    if len(keys) == 1: return lambda values, key=keys[0]: (values[key],)
+    return itemgetter(*keys)
+
+# Returns the receiver args for the given metadata key
+def _args(key):
+    return dict((name, value)
+                for name, value in zip(METADATA, key) if value is not None)
+
+# Post the given body of events with the given metadata key to the simple
+# receiver, reading the response so the connection can be reused.
+def _post(service, key, body):
+    service.post(PATH_SIMPLE, body=body, **_args(key)).body.read()
+
+# Returns a throughput record for the given counts, accumulated since the
+# given start time.
+def _throughput(started, events, bytes, **kwargs):
+    elapsed = max(time() - started, 1e-6)
+    result = record(kwargs)
+    result.events = events
+    result.bytes = bytes
+    result.seconds = elapsed
+    result.events_per_sec = events/elapsed
+    result.bytes_per_sec = bytes/elapsed
+    return result
+
+class EventEncoder(object):
+    """Encodes events as space separated key="value" fields, optionally
+       prefixed with a timestamp and followed by a terminator. The values
+       of the given known fields are written first, in order, followed by
+       any other fields in sorted order, with a format built once for each
+       set of fields. Values are quoted, with backslashes, quotes and line
+       breaks escaped, lists are joined with commas and None values are
+       left out. Events are written into a bytearray, which the writers and
+       submitters in this module take directly, copying it once so that
+       the buffer can be reused. Encoders reuse their buffer, so each
+       thread needs its own."""
+    def __init__(self, fields=(), timestamp=False, terminator=""):
+        self.fields = tuple(fields)
+        self.timestamp = timestamp
+        self.terminator = terminator
+        self.buffer = bytearray()
+        self._known = frozenset(self.fields)
+        self._layouts = {} # Field names => (ordered names, format, getter)
+
+    # Returns the ordered field names, format and value getter for the
+    # given dict's fields, building them the first time they are seen.
+    def _layout(self, values):
+        key = tuple(values)
+        layout = self._layouts.get(key, None)
+        if layout is None:
+            if len(self._layouts) >= MAX_LAYOUTS: self._layouts.clear()
+            known = self._known
+            names = tuple(
+                [name for name in self.fields if name in values] +
+                sorted(name for name in key if name not in known))
+            format = " ".join(
+                '%s="%%s"' % name.replace("%", "%%") for name in names)
+            layout = self._layouts[key] = (names, format, _getter(names))
+        return layout
+
+    def encode(self, values, time=None):
+        """Encodes an event with the given dict of field values, returning
+           the encoder's buffer, which is overwritten by the next call."""
+        buffer = self.buffer
+        del buffer[:]
+        return self.write(buffer, values, time)
+
+    def write(self, buffer, values, time=None):
+        """Appends an event with the given dict of field values to the
+           given bytearray, prefixed with the given time, or the current
+           time if the encoder is timestamped. Returns the buffer."""
+        if time is None and self.timestamp: time = datetime.now()
+        if time is not None:
+            isoformat = getattr(time, "isoformat", None)
+            buffer.extend(str(time) if isoformat is None else isoformat())
+        names, format, getter = self._layout(values)
+        items = getter(values)
+        try:
+            joined = "".join(items) # Fails unless all values are str
+        except TypeError:
+            joined = None
+        if joined.__class__ is str and _clean(joined): # Format as is
+            encoded = format % items
+        else:
+            encoded = _encode(names, items)
+        if encoded and time is not None: buffer.extend(" ")
+        buffer.extend(encoded)
+        buffer.extend(self.terminator)
+        return buffer
+
+class BatchSubmitter(object):
+    """Submits events to the simple receiver in batches. Events that share
+       metadata (index, host, source & sourcetype) are joined, each ending
+       with separator, into a single POST body that is sent once batchsize
+       bytes are batched or the oldest event has waited linger seconds. Up
+       to concurrency POSTs are in flight at a time over the service's
+       pooled connections, submitters block while a full batch waits for
+       one to complete. A batch whose POST fails is not retried, the error
+       is raised once, by the next call to submit, flush or close, with
+       the failed batches as its batches attribute, a list of (metadata,
+       body) pairs that may be submitted again."""
+    def __init__(self, service, batchsize=DEFAULT_BATCHSIZE,
+                 linger=DEFAULT_LINGER, concurrency=DEFAULT_WORKERS,
+                 separator="\n"):
+        self.service = service
+        self.batchsize = batchsize
+        self.linger = linger
+        self.concurrency = concurrency
+        self.separator = separator
+        self.events = 0 # Events submitted
+        self.bytes = 0 # Bytes posted
+        self.posts = 0 # Requests completed
+        self._batches = {} # metadata => (since, size, events)
+        self._inflight = 0 # Requests submitted but not yet completed
+        self._closed = False
+        self._error = None # The error that failed a request
+        self._failed = [] # (metadata, body) of the failed batches
+        self._cond = threading.Condition(threading.Lock())
+        self._started = time()
+        self._executor = Executor(concurrency)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    # Raise the error that failed a request, if any, handing back the
+    # failed batches with it, and clear it, call holding _cond.
+    def _check(self):
+        error = self._error
+        if error is None: return
+        error.batches = self._failed
+        self._error = None
+        self._failed = []
+        raise error
+
+    # Post the batch with the given metadata, waiting for a free request
+    # slot first, call holding _cond. Another caller may have posted the
+    # batch while we waited.
+    def _dispatch(self, key):
+        while self._inflight >= self.concurrency: self._cond.wait()
+        batch = self._batches.pop(key, None)
+        if batch is None: return
+        since, size, events = batch
+        self._inflight += 1
+        self._executor.submit(self._post, key, "".join(events), len(events))
+
+    def _post(self, key, body, count):
+        try:
+            _post(self.service, key, body)
+        except Exception as e:
+            with self._cond:
+                if self._error is None: self._error = e
+                self._failed.append((_args(key), body))
+        else:
+            with self._cond:
+                self.bytes += len(body)
+                self.posts += 1
+        finally:
+            with self._cond:
+                self._inflight -= 1
+                self._cond.notify_all()
+
+    # The linger thread, posts batches once they have waited long enough
+    def _run(self):
+        with self._cond:
+            while not self._closed:
+                now = time()
+                timeout = None
+                for key, batch in self._batches.items():
+                    remaining = batch[0] + self.linger - now
+                    if remaining <= 0:
+                        self._dispatch(key)
+                    elif timeout is None or remaining < timeout:
+                        timeout = remaining
+                self._cond.wait(timeout)
+
+    def close(self):
+        """Post any batched events and wait for them to be sent, raising
+           the error that failed a request, if any."""
+        with self._cond:
+            if self._closed: return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
+
+    def flush(self):
+        """Post any batched events and wait for all requests to complete,
+           raising the error that failed a request, if any."""
+        with self._cond:
+            for key in self._batches.keys(): self._dispatch(key)
+            while self._inflight > 0: self._cond.wait()
+            self._check()
+
+    def stats(self):
+        """Returns the submitter's throughput so far: events submitted,
+           bytes posted, requests completed, and events and bytes per
+           second."""
+        return _throughput(
+            self._started, self.events, self.bytes, posts=self.posts)
+
+    def submit(self, event, index=None, host=None, source=None,
+               sourcetype=None):
+        """Add the given event to the batch for the given metadata, posting
+           the batch once it is full."""
+        event = _data(event)
+        if not event.endswith(self.separator): event += self.separator
+        key = (index, host, source, sourcetype)
+        with self._cond:
+            self._check()
+            if self._closed: raise ValueError("Submit to a closed submitter")
+            batch = self._batches.get(key, None)
+            if batch is None:
+                batch = self._batches[key] = (time(), 0, [])
+                self._cond.notify_all() # Start the linger clock
+            since, size, events = batch
+            events.append(event)
+            size += len(event)
+            self._batches[key] = (since, size, events)
+            self.events += 1
+            if size >= self.batchsize: self._dispatch(key)
+
+# Spool segments are files of frames, each a header giving the lengths of
+# the event's metadata and data, followed by both. The header is written
+# last, so a frame with a header is complete, and the zero-filled space
+# after the last frame reads as a header of zeros.
+SPOOL_FRAME = struct.Struct("<II")
+SPOOL_SUFFIX = ".spool"
+SPOOL_CHECKPOINT = "checkpoint"
+SPOOL_SEPARATOR = "\x1f" # Separates metadata values
+
+class Spool(object):
+    """A durable, disk-backed queue in front of event ingestion. Submitted
+       events are appended to memory-mapped segment files in the given
+       directory, and a drainer thread ships them to the service's simple
+       receiver, up to batchsize bytes at a time, checkpointing the
+       position of the events acknowledged so far. Events that were not
+       acknowledged, because splunkd was unavailable or the process exited,
+       are shipped once a spool is opened on the directory again. Delivery
+       is at least once. The streaming receiver never acknowledges the data
+       it is sent, so the spool doesn't ship to it."""
+    def __init__(self, service, directory, segmentsize=DEFAULT_SEGMENTSIZE,
+                 batchsize=DEFAULT_BATCHSIZE, concurrency=DEFAULT_WORKERS,
+                 separator="\n"):
+        self.service = service
+        self.directory = directory
+        self.segmentsize = segmentsize
+        self.batchsize = batchsize
+        self.separator = separator
+        self.events = 0 # Events shipped
+        self.bytes = 0 # Bytes shipped
+        self.failures = 0 # Failed shipping attempts
+        self.error = None # The error that failed the last attempt, if any
+        self._segments = {} # sequence => mmap
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        self._started = time()
+        if not os.path.isdir(directory): os.makedirs(directory)
+        self._recover()
+        self._executor = Executor(concurrency)
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    # Write the given position as the checkpoint, atomically replacing the
+    # previous one.
+    def _checkpoint(self, position):
+        path = self._path(SPOOL_CHECKPOINT)
+        with open(path + ".tmp", "wb") as file:
+            file.write("%d %d\n" % position)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.name == "nt" and os.path.exists(path): os.remove(path)
+        os.rename(path + ".tmp", path)
+
+    # Drop the segments before the given sequence, call holding _cond
+    def _discard(self, sequence):
+        for item in self._segments.keys():
+            if item >= sequence: continue
+            self._segments.pop(item).close()
+            os.remove(self._path("%016d%s" % (item, SPOOL_SUFFIX)))
+
+    # Answers the (metadata, event, next offset) of the frame at the given
+    # offset of the given segment, or None past the last frame.
+    def _frame(self, segment, offset):
+        if offset + SPOOL_FRAME.size > len(segment): return None
+        metasize, size = SPOOL_FRAME.unpack_from(segment, offset)
+        if metasize == 0: return None
+        start = offset + SPOOL_FRAME.size
+        end = start + metasize + size
+        return segment[start:start+metasize], segment[start+metasize:end], end
+
+    # Map the segment with the given sequence number, creating it with the
+    # given size if it doesn't exist.
+    def _open(self, sequence, size=None):
+        path = self._path("%016d%s" % (sequence, SPOOL_SUFFIX))
+        exists = os.path.exists(path)
+        with open(path, "r+b" if exists else "w+b") as file:
+            if not exists: file.truncate(size)
+            segment = mmap.mmap(file.fileno(), 0)
+        self._segments[sequence] = segment
+        return segment
+
+    # Read the shipping position from the checkpoint, map the remaining
+    # segments and start a new one for appends, so that new frames never
+    # follow a frame left incomplete by a crash. A crash may also leave a
+    # segment that was created but not yet sized, which holds no frames and
+    # can't be mapped, so it is removed.
+    def _recover(self):
+        sequences = sorted(
+            int(name[:-len(SPOOL_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SPOOL_SUFFIX))
+        path = self._path(SPOOL_CHECKPOINT)
+        position = (0, 0)
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                position = tuple(int(item) for item in file.read().split())
+        for sequence in sequences:
+            path = self._path("%016d%s" % (sequence, SPOOL_SUFFIX))
+            if os.path.getsize(path) == 0: os.remove(path)
+            else: self._open(sequence)
+        self._discard(position[0])
+        if len(self._segments) > 0: # Resume shipping the spooled events
+            if position[0] not in self._segments:
+                position = (min(self._segments), 0)
+            sequence = max(self._segments) + 1
+        else:
+            sequence = position[0]
+            position = (sequence, 0)
+        self._open(sequence, self.segmentsize)
+        self._position = position # Of the first unacknowledged event
+        self._head = (sequence, 0) # Where the next event is appended
+
+    # Read events from the given position, up to the given head or until
+    # batchsize bytes are read, answers the events by metadata, their
+    # count and size, and the position following them. Segments are looked
+    # up holding _cond, since submit may add one meanwhile, but the frames
+    # before the head are complete and no longer written to, so they are
+    # read without it.
+    def _read(self, position, head):
+        batches = {}
+        count = size = 0
+        sequence, offset = position
+        segment = None
+        while (sequence, offset) != head and size < self.batchsize:
+            if segment is None:
+                with self._cond: segment = self._segments[sequence]
+            frame = self._frame(segment, offset)
+            if frame is None: # On to the next segment
+                sequence, offset = sequence + 1, 0
+                segment = None
+                continue
+            meta, event, offset = frame
+            batches.setdefault(meta, []).append(event)
+            count += 1
+            size += len(event)
+        return batches, count, size, (sequence, offset)
+
+    # The drainer thread, ships events as they are spooled, retrying with
+    # backoff while shipping fails.
+    def _run(self):
+        delay = BACKOFF_MIN
+        while True:
+            with self._cond:
+                while self._position == self._head and not self._closed:
+                    self._cond.wait()
+                if self._closed: return
+                position, head = self._position, self._head
+            batches, count, size, position = self._read(position, head)
+            try:
+                self._ship(batches)
+            except Exception as e:
+                with self._cond:
+                    self.failures += 1
+                    self.error = e
+                    self._cond.wait(delay) # Unless closed
+                delay = min(delay*2, BACKOFF_MAX)
+                continue
+            delay = BACKOFF_MIN
+            self._checkpoint(position)
+            with self._cond:
+                self._position = position
+                self._discard(position[0])
+                self.events += count
+                self.bytes += size
+                self.error = None
+                self._cond.notify_all()
+
+    # Ship the given events, by metadata, to the simple receiver, answering
+    # once every batch is acknowledged.
+    def _ship(self, batches):
+        futures = []
+        for meta, events in batches.iteritems():
+            key = tuple(value or None for value in meta.split(SPOOL_SEPARATOR))
+            futures.append(self._executor.submit(
+                _post, self.service, key, "".join(events)))
+        for future in futures: future.result()
+
+    def close(self):
+        """Stop the drainer and close the spool. Events not yet shipped
+           stay spooled, call flush first to wait for them to be shipped."""
+        with self._cond:
+            if self._closed: return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._executor.shutdown()
+        for segment in self._segments.values(): segment.close()
+        self._segments = {}
+
+    def flush(self, timeout=None):
+        """Wait until all events submitted so far have been shipped, raises
+           RuntimeError if timeout seconds pass first."""
+        deadline = None if timeout is None else time() + timeout
+        with self._cond:
+            head = self._head
+            while self._position < head:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        raise RuntimeError("Timed out waiting for spool")
+                self._cond.wait(remaining)
+
+    def stats(self):
+        """Returns the spool's throughput so far: events and bytes shipped,
+           failed attempts, and events and bytes per second."""
+        return _throughput(self._started, self.events, self.bytes,
+                           failures=self.failures)
+
+    def submit(self, event, index=None, host=None, source=None,
+               sourcetype=None):
+        """Append the given event, with the given metadata, to the spool."""
+        event = _data(event)
+        if not event.endswith(self.separator): event += self.separator
+        meta = SPOOL_SEPARATOR.join(
+            value or "" for value in [index, host, source, sourcetype])
+        if isinstance(meta, unicode): meta = meta.encode("utf-8")
+        size = SPOOL_FRAME.size + len(meta) + len(event)
+        with self._cond:
+            if self._closed: raise ValueError("Submit to a closed spool")
+            sequence, offset = self._head
+            segment = self._segments[sequence]
+            if offset + size > len(segment): # On to a new segment
+                sequence, offset = sequence + 1, 0
+                segment = self._open(sequence, max(self.segmentsize, size))
+            start = offset + SPOOL_FRAME.size
+            segment[start:start+len(meta)] = meta
+            segment[start+len(meta):offset+size] = event
+            SPOOL_FRAME.pack_into(segment, offset, len(meta), len(event))
+            self._head = (sequence, offset + size)
+            self._cond.notify_all()
+
+    def sync(self):
+        """Flush spooled events to disk, so that they also survive a crash
+           of the host rather than just of the process."""
+        with self._cond:
+            for segment in self._segments.values(): segment.flush()
+
+class StreamWriter(object):
+    """A buffered writer for a Splunk streaming receiver connection, see
+       Index.attach. Written data is coalesced and sent by a background
+       thread once bufsize bytes are buffered or the oldest data has waited
+       linger seconds, writers block while maxbuffer bytes are waiting to
+       be sent. If the connection drops it is reopened, and the data being
+       sent is resent along with the data sent just before it, which the
+       receiver may not have got, so delivery is at least once. The data
+       sent last before the writer is closed is the exception, since the
+       receiver never acknowledges it."""
+    def __init__(self, service, path, bufsize=DEFAULT_BUFSIZE,
+                 linger=DEFAULT_LINGER, maxbuffer=DEFAULT_MAXBUFFER,
+                 retries=DEFAULT_RETRIES):
+        self.service = service
+        self.path = path
+        self.bufsize = bufsize
+        self.linger = linger
+        self.maxbuffer = maxbuffer
+        self.retries = retries
+        self.events = 0 # Writes buffered
+        self.bytes = 0 # Bytes sent
+        self.reconnects = 0
+        self._pending = [] # Buffered data, not yet being sent
+        self._size = 0 # Bytes pending
+        self._since = None # When the oldest pending data was written
+        self._sending = 0 # Bytes being sent
+        self._sent = [] # The writes sent last, see _send
+        self._flushing = 0 # Number of callers waiting in flush
+        self._closed = False
+        self._error = None # The error that stopped the sender
+        self._cond = threading.Condition(threading.Lock())
+        self._started = time()
+        self._socket = self._connect()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    # Raise the error that stopped the sender, if any
+    def _check(self):
+        if self._error is not None: raise self._error
+
+    # Open a connection to the receiver and send the request head, using
+    # the Splunk extension header to note the input mode.
+    def _connect(self):
+        service = self.service
+        head = "".join([
+            "POST %s HTTP/1.1\r\n" % service.fullpath(self.path),
+            "Host: %s:%s\r\n" % (service.host, service.port),
+            "Accept-Encoding: identity\r\n",
+            "Authorization: %s\r\n" % service.token,
+            "X-Splunk-Input-Mode: Streaming\r\n",
+            "\r\n"])
+        connection = service.connect()
+        try:
+            connection.sendall(head)
+        except:
+            connection.close()
+            raise
+        return connection
+
+    # Answers if the pending data should be sent now, call holding _cond
+    def _due(self):
+        if self._size == 0: return False
+        if self._size >= self.bufsize: return True
+        if self._flushing > 0 or self._closed: return True
+        return time() - self._since >= self.linger
+
+    # The sender thread, sends pending data as it comes due
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due():
+                    if self._closed and self._size == 0: return
+                    timeout = None
+                    if self._since is not None:
+                        timeout = max(0, self._since + self.linger - time())
+                    self._cond.wait(timeout)
+                pending, size = self._pending, self._size
+                self._pending = []
+                self._size = 0
+                self._since = None
+                self._sending = size
+            try:
+                self._send(pending)
+            except Exception as e:
+                with self._cond:
+                    self._error = e
+                    self._sending = 0
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self.bytes += size
+                self._sending = 0
+                self._cond.notify_all()
+
+    # Answers if the receiver has closed the connection. The receiver sends
+    # nothing while the request is streaming, so a readable connection has
+    # been closed (or answered, which ends the request).
+    def _dropped(self):
+        readable, _, _ = select.select([self._socket], [], [], 0)
+        return len(readable) > 0
+
+    # Send the given pending writes, reopening the connection and resending
+    # them if the connection drops. A send only fails once the receiver has
+    # reset the connection, so a send that follows a close succeeds and its
+    # data is lost: check for a close before each send, and on reconnecting
+    # resend the writes sent last as well, in case the close raced them.
+    def _send(self, pending):
+        delay = BACKOFF_MIN
+        attempt = 0
+        resend = [] # Writes the receiver may not have got
+        while True:
+            try:
+                if self._socket is not None and self._dropped():
+                    self._socket.close()
+                    self._socket = None
+                if self._socket is None:
+                    self._socket = self._connect()
+                    self.reconnects += 1
+                    resend = self._sent
+                self._write(resend + pending)
+                self._sent = pending
+                return
+            except socket.error:
+                if self._socket is not None:
+                    self._socket.close()
+                    self._socket = None
+                attempt += 1
+                if attempt > self.retries: raise
+                sleep(delay)
+                delay = min(delay*2, BACKOFF_MAX)
+
+    # Write the given pending writes to the connection
+    def _write(self, pending):
+        self._socket.sendall("".join(pending))
+
+    def close(self):
+        """Send any buffered data and close the connection, raising the
+           error that stopped the sender, if any."""
+        with self._cond:
+            if self._closed: return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        self._check()
+
+    def flush(self):
+        """Send everything buffered so far, blocking until it is sent."""
+        with self._cond:
+            self._flushing += 1
+            try:
+                self._cond.notify_all()
+                while self._size + self._sending > 0:
+                    self._check()
+                    self._cond.wait()
+                self._check()
+            finally:
+                self._flushing -= 1
+
+    def stats(self):
+        """Returns the writer's throughput so far: writes buffered (events),
+           bytes sent, reconnects, and events and bytes per second."""
+        return _throughput(self._started, self.events, self.bytes,
+                           reconnects=self.reconnects)
+
+    def write(self, data):
+        """Buffer the given event data to be sent, blocking while the buffer
+           is full."""
+        data = _data(data)
+        with self._cond:
+            self._check()
+            if self._closed: raise ValueError("Write to a closed stream")
+            while self._size + self._sending >= self.maxbuffer:
+                self._cond.wait()
+                self._check()
+            wake = self._since is None # Start the sender's linger clock
+            if wake: self._since = time()
+            self._pending.append(data)
+            self._size += len(data)
+            self.events += 1
+            if wake or self._size >= self.bufsize: self._cond.notify_all()
+
+# A StreamWriter for a raw TCP or UDP network input, which takes the data
+# as is, without a request head. Each write to a UDP input is sent as its
+# own datagram.
+class _InputWriter(StreamWriter):
+    def __init__(self, address, kind, **kwargs):
+        self.address = address
+        self.kind = kind
+        StreamWriter.__init__(self, None, None, **kwargs)
+
+    def _connect(self):
+        if self.kind == "tcp": return socket.create_connection(self.address)
+        connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            connection.connect(self.address)
+        except:
+            connection.close()
+            raise
+        return connection
+
+    def _write(self, pending):
+        if self.kind == "tcp": return StreamWriter._write(self, pending)
+        for data in pending: self._socket.send(data)
+
+class InputSender(object):
+    """Sends events to a raw TCP (or UDP) network input on the given port,
+       creating the input with the given args if it doesn't exist. Keeps a
+       pool of connections to each of the given indexer hosts, defaulting
+       to the service's host, and writes events to the connections in turn,
+       moving on to the next connection after each bufsize bytes. Each
+       connection buffers and reconnects like a StreamWriter, so delivery
+       is at least once but events sent over different connections may
+       arrive out of order."""
+    def __init__(self, service, port, kind="tcp", hosts=None,
+                 connections=DEFAULT_CONNECTIONS, bufsize=DEFAULT_BUFSIZE,
+                 linger=DEFAULT_LINGER, maxbuffer=DEFAULT_MAXBUFFER,
+                 retries=DEFAULT_RETRIES, **kwargs):
+        if kind not in ["tcp", "udp"]:
+            raise ValueError("Unknown input kind: %s" % kind)
+        inputs = service.inputs
+        if not inputs.contains(inputs.itemkey(kind, port)):
+            inputs.create(kind, port, **kwargs)
+        if hosts is None: hosts = [service.host]
+        self.service = service
+        self.port = int(port)
+        self.kind = kind
+        self.bufsize = bufsize
+        self._writers = []
+        self._current = 0 # Index of the writer being written to
+        self._written = 0 # Bytes written to the current writer
+        self._lock = threading.Lock()
+        self._started = time()
+        try:
+            for i in range(connections):
+                for host in hosts: # Interleaved, to spread over hosts
+                    self._writers.append(_InputWriter(
+                        (host, self.port), kind, bufsize=bufsize,
+                        linger=linger, maxbuffer=maxbuffer, retries=retries))
+        except:
+            for writer in self._writers: writer.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        """Send any buffered events and close the connections, raising the
+           first error that stopped a connection, if any."""
+        error = None
+        for writer in self._writers:
+            try:
+                writer.close()
+            except Exception as e:
+                if error is None: error = e
+        if error is not None: raise error
+
+    def flush(self):
+        """Send everything buffered so far, blocking until it is sent."""
+        for writer in self._writers: writer.flush()
+
+    def stats(self):
+        """Returns the sender's throughput so far: events written, bytes
+           sent, reconnects, and events and bytes per second."""
+        writers = self._writers
+        return _throughput(self._started,
+            sum(writer.events for writer in writers),
+            sum(writer.bytes for writer in writers),
+            reconnects=sum(writer.reconnects for writer in writers),
+            connections=len(writers))
+
+    def write(self, event):
+        """Buffer the given event to be sent on the current connection."""
+        event = _data(event)
+        with self._lock:
+            if self._written >= self.bufsize: # On to the next connection
+                self._current = (self._current + 1) % len(self._writers)
+                self._written = 0
+            self._writers[self._current].write(event)
+            self._written += len(event)
@@ -0,0 +1,99 @@
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Persistent HTTP connections for the binding layer, see
+   splunk.binding.handler."""
+
+import select
+import socket
+import threading
+from time import time
+import urllib
+
+__all__ = [
+    "ConnectionPool",
+]
+
+DEFAULT_POOLSIZE = 10 # Max idle connections kept per (scheme, host, port)
+DEFAULT_IDLETIME = 60 # Seconds an idle connection may be kept for reuse
+
+# Crack the given url into (scheme, host, port, path)
+def spliturl(url):
+    scheme, part = url.split(':', 1)
+    host, path = urllib.splithost(part)
+    host, port = urllib.splitnport(host, 80)
+    return scheme, host, port, path
+
+
+# Answers if the given idle connection can no longer be used, ie: its socket
+# is gone or has become readable, which for an idle HTTP connection means
+# that the server has closed it (or sent something we did not ask for).
+def _isstale(connection):
+    sock = connection.sock
+    if sock is None: return True
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (select.error, socket.error, ValueError):
+        return True
+    return len(readable) > 0
+
+class ConnectionPool(object):
+    """A thread-safe pool of persistent HTTP/1.1 connections, keyed by
+       (scheme, host, port). At most maxsize idle connections are kept per
+       key and connections idle for longer than idletime seconds, or that
+       the server has closed, are evicted instead of being reused."""
+    def __init__(self, connect,
+                 maxsize=DEFAULT_POOLSIZE, idletime=DEFAULT_IDLETIME):
+        self.connect = connect # connect(scheme, host, port)
+        self.maxsize = maxsize
+        self.idletime = idletime
+        self._idle = {} # (scheme, host, port) => [(connection, time)*]
+        self._lock = threading.Lock()
+
+    def acquire(self, scheme, host, port):
+        """Returns a (connection, reused) pair for the given endpoint,
+           reusing an idle connection if a live one is available."""
+        key = (scheme, host, port)
+        now = time()
+        stale = []
+        try:
+            with self._lock:
+                idle = self._idle.get(key, [])
+                while len(idle) > 0:
+                    connection, since = idle.pop() # Most recently used
+                    if now - since <= self.idletime \
+                       and not _isstale(connection):
+                        return connection, True
+                    stale.append(connection)
+        finally:
+            for connection in stale: connection.close()
+        return self.connect(scheme, host, port), False
+
+    def clear(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for connections in idle.itervalues():
+            for connection, _ in connections: connection.close()
+
+    def release(self, scheme, host, port, connection):
+        """Return the given connection to the pool for reuse."""
+        if connection.sock is None: return # Closed, nothing to keep
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host, port), [])
+            if len(idle) < self.maxsize:
+                idle.append((connection, time()))
+                return
+        connection.close()
@@ -14,44 +14,67 @@
 
 """A progressive XML reader."""
 
-from cStringIO import StringIO
-import xml.dom.pulldom as pulldom
+try:
+    from xml.etree.cElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+from itertools import izip
+try:
+    import numpy
+except ImportError:
+    numpy = None # Optional, for ResultsReader.batches(arrays=True)
 
 __all__ = [
     "ResultsReader"
 ]
 
-# Splices a list of strings and file-like objects into a single stream
+HEAD_SIZE = 4096 # Bytes read at a time when scanning the head of a stream
+
+DEFAULT_BATCHSIZE = 1000 # Rows per batch, see ResultsReader.batches
+
+# A file-like view of a string that hands out the string itself, rather 
+# than a copy, when asked for all of it. A partial read returns a slice,
+# which is a copy of that part of the string.
+class StringStream:
+    def __init__(self, value):
+        self.value = value
+        self.offset = 0
+
+    def read(self, size=-1):
+        value, offset = self.value, self.offset
+        if offset == 0 and (size < 0 or size >= len(value)):
+            self.offset = len(value)
+            return value
+        end = len(value) if size < 0 else offset + size
+        self.offset = min(end, len(value))
+        return value[offset:end]
+
+# Splices a list of strings and file-like objects into a single stream. 
+# Chunks are passed through as read from the underlying files, a read may 
+# return fewer bytes than requested (but only returns "" at the end of the
+# stream), so the splicer does not join or copy them. Only a string part
+# that is read in pieces is copied, see StringStream.
 class ListStream:
     def __init__(self, *args):
-        count = len(args)
-        if count == 0:
-            self.args = []
-            self.file = None
-        else:
-            self.args = args
-            self.file = self._next()
-
-    def read(self, size):
-        result = ""
-        while True:
-            if self.file is None: 
-                return result
+        self.args = list(args)
+        self.args.reverse() # So we can pop the next item off the end
+        self.file = self._next()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return "".join(iter(lambda: self.read(HEAD_SIZE), ""))
+        while self.file is not None:
             chunk = self.file.read(size)
-            result += chunk
-            count = len(chunk)
-            if count == size: 
-                return result
-            size -= count
+            if len(chunk) > 0: return chunk
             self.file = self._next()
+        return ""
 
     def _next(self):
         if len(self.args) == 0: 
             return None
-        item = self.args[0]
-        self.args = self.args[1:]
+        item = self.args.pop()
         if isinstance(item, str): 
-            return StringIO(item)
+            return StringStream(item)
         return item
             
 # A file-like interface that will convert a stream of XML fragments, into
@@ -63,28 +86,23 @@ class XMLStream:
 
     # Prepare the stream by scanning the head of the stream until we find 
     # the first XML element so that we know where to inject the artificial 
-    # document wrapper.
+    # document wrapper. Only the head is copied, the rest of the stream is
+    # spliced in as is.
     @staticmethod
     def prepare(file_):
         head = ""
         start = 0
-        headsize = 0
         while True:
-            chunk = file_.read(180)
-            chunksize = len(chunk)
-            if chunksize == 0: 
-                return
-            head += chunk
-            headsize += chunksize
             index = head.find('<', start)
-            if index == -1: # Not found
-                start = headsize
-                continue
-            if index+1 == headsize: # Found on last byte of head
-                # Comment or PI char may the first char in the in next 
-                # chunk .. so advance start pointer to current index and 
-                # read next chunk
-                start = index
+            if index == -1 or index+1 == len(head):
+                # Not found, or found on the last byte of the head in which
+                # case a comment or PI char may be the first char of the 
+                # next chunk, so read on.
+                chunk = file_.read(HEAD_SIZE)
+                if len(chunk) == 0: 
+                    return None
+                start = len(head) if index == -1 else index
+                head = chunk if len(head) == 0 else head + chunk
                 continue
             next_ = head[index+1]
             if next_ == '!' or next_ == '?':
@@ -94,141 +112,189 @@ class XMLStream:
             return ListStream(
                 head[:index], "<doc>", head[index:], file_, "</doc>\n")
 
-    def read(self, size):
+    def read(self, size=-1):
         if self.file is not None:
             return self.file.read(size)
         else:
             raise StopIteration
-            
-# A simplified XML 'reader' interface, that also abstracts the pulldom
-TAG = "TAG"         # kind, name, attrs
-END = "END"         # kind, name
-VAL = "VAL"         # kind, value
-class XMLReader:
-    def __init__(self, stream):
-        self._items = pulldom.parse(XMLStream(stream), bufsize = 256)
-        self._item = None   # The current item
-        self._next = None   # 1 item pushback buffer
-        self.kind = None
-        self.name = None
-        self.attrs = None
-        self.value = None
+
+XNAME_XML = "{http://www.w3.org/XML/1998/namespace}%s"
+
+# Elements that may appear outside of a result, message or meta section
+OUTER = ["doc", "messages", "results"]
+
+# Encode the given text as UTF-8, the parser returns plain str for ASCII
+def _utf8(text):
+    return text.encode("utf8") if isinstance(text, unicode) else text
+
+# Escape text the way minidom does
+def _escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;") \
+               .replace("\"", "&quot;").replace(">", "&gt;")
+
+# Returns the XML qualified name for the given element or attribute name
+def _qname(name):
+    if name[0] != '{': return name
+    uri, local = name[1:].split('}', 1)
+    if XNAME_XML % local == name: return "xml:" + local
+    return local
+
+# Serialize the given element as UTF-8 exactly as minidom's toxml does, ie:
+# attributes sorted by name, empty elements closed with "/>" and text 
+# escaped, so that '<v>' field values are unchanged from earlier readers.
+def _toxml(element, out=None):
+    result = out is None
+    if result: out = []
+    tag = _qname(element.tag)
+    out.append("<" + tag)
+    attrs = sorted([(_qname(name), value) 
+                    for name, value in element.attrib.iteritems()])
+    for name, value in attrs:
+        out.append(" %s=\"%s\"" % (name, _escape(value)))
+    if element.text or len(element):
+        out.append(">")
+        if element.text: out.append(_escape(element.text))
+        for child in element:
+            _toxml(child, out)
+            if child.tail: out.append(_escape(child.tail))
+        out.append("</%s>" % tag)
+    else:
+        out.append("/>")
+    if result: return _utf8("".join(out))
+
+# Convert the given column of field values to a NumPy array: integer or
+# float if every value is numeric (with NaN for missing values in a float 
+# column), or an array of objects otherwise.
+def _array(values):
+    try:
+        return numpy.array([int(value) for value in values], numpy.int64)
+    except (OverflowError, TypeError, ValueError):
+        pass
+    try:
+        return numpy.array([numpy.nan if value is None else float(value) 
+                            for value in values], numpy.float64)
+    except (TypeError, ValueError):
+        pass
+    result = numpy.empty(len(values), object) # Elementwise, values may be 
+    for i, value in enumerate(values):        # multivalue lists
+        result[i] = value
+    return result
+
+# Returns the text of the given element, or None if it is blank
+def _text(element):
+    text = element.text
+    if text is None or len(text.strip()) == 0: return None
+    return text
+
+# The field names of a results section, shared by the section's rows. Names
+# are interned and may be added as new fields are seen.
+class Schema(object):
+    __slots__ = ("names", "index")
+
+    def __init__(self, names=()):
+        self.names = [] # Field names in slot order
+        self.index = {} # Field name => slot
+        for name in names: self.add(name)
+
+    def add(self, name):
+        """Returns the slot of the given field name, adding it if new."""
+        index = self.index.get(name, None)
+        if index is None:
+            if isinstance(name, str): name = intern(name)
+            index = self.index[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+class Row(object):
+    """A compact search result, see ResultsReader, ie: a list of field
+       values laid out according to the Schema shared by all results of the
+       section, offering the usual dict interface. A field whose value is
+       None is taken to be absent. A Row is not a dict, use dict(row) where
+       a real dict is needed, eg: to serialize it."""
+    __slots__ = ("_schema", "_values")
+
+    __hash__ = None # Mutable, like a dict
+
+    def __init__(self, schema, values):
+        self._schema = schema
+        self._values = values
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __delitem__(self, key):
+        if key not in self: raise KeyError(key)
+        self._values[self._schema.index[key]] = None
+
+    def __eq__(self, other):
+        if isinstance(other, Row): other = dict(other.iteritems())
+        return dict(self.iteritems()) == other
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None: raise KeyError(key)
+        return value
 
     def __iter__(self):
-        return self
+        return self.iterkeys()
 
-    def _scan(self):
-        if self._next is not None:
-            item = self._next
-            self._next = None
-            return item
-        try:
-            item = self._items.next()
-        except StopIteration:
-            item = None
-        return item
+    def __len__(self):
+        return len(self._values) - self._values.count(None)
 
-    def _push(self, item):
-        assert self._next is None
-        self._next = item
+    def __ne__(self, other):
+        return not self == other
 
-    def expand(self):
-        """Expands the current node into a minidom."""
-        if not self.kind == TAG: 
-            raise Exception, "Illegal operation"
-        node = self._item[1]
-        self._items.expandNode(node)
-        return node
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
 
-    @property
-    def item(self):
-        return {
-            TAG: (TAG, self.name, self.attrs),
-            END: (END, self.name),
-            VAL: (VAL, self.value)
-        }[self.kind]
-
-    def isend(self, name = None):
-        if self.kind != END: 
-            return False
-        if name is not None: 
-            return name == self.name
-        return True
-
-    def istag(self, name = None):
-        if self.kind != TAG: 
-            return False
-        if name is not None: 
-            return name == self.name
-        return True
-
-    def isval(self):
-        return self.kind == VAL
+    def __setitem__(self, key, value):
+        index = self._schema.add(key)
+        values = self._values
+        if index >= len(values): values.extend([None] * (index+1-len(values)))
+        values[index] = value
 
-    def next(self):
-        """An iterator interface to the reader, returns a tuple of values
-           corresponding to the current item."""
-        if self.read() is None: 
-            raise StopIteration
-        return self.item
+    def get(self, key, default=None):
+        index = self._schema.index.get(key, None)
+        if index is None or index >= len(self._values): return default
+        value = self._values[index]
+        return default if value is None else value
 
-    def read(self):
-        self._item = self._scan()
+    has_key = __contains__
 
-        if self._item is None: 
-            self.kind = None
-            self.name = None
-            self.attrs = None
-            self.value = None
-            return None
+    def items(self):
+        return list(self.iteritems())
+
+    def iteritems(self):
+        for name, value in izip(self._schema.names, self._values):
+            if value is not None: yield name, value
+
+    def iterkeys(self):
+        for name, value in self.iteritems(): yield name
+
+    def itervalues(self):
+        for name, value in self.iteritems(): yield value
 
-        elem, name = self._item
-
-        if elem == pulldom.START_ELEMENT:
-            self.kind = TAG
-            self.name = name.tagName
-            self.attrs = dict(name.attributes.items()) \
-                if name.hasAttributes() else None
-            self.value = None
-            return TAG
-
-        if elem == pulldom.END_ELEMENT:
-            self.kind = END
-            self.name = name.tagName
-            self.attrs = None
-            self.value = None
-            return END
-
-        if elem == pulldom.CHARACTERS:
-            self.kind = VAL
-            self.name = None
-            self.attrs = None
-            self.value = name.data
-            while True: # Merge adjacent CHARACTERS
-                elem, name = item = self._scan()
-                if elem != pulldom.CHARACTERS:
-                    self._push(item)
-                    break
-                self.value += name.data
-            if len(self.value.strip()) == 0: 
-                self.read()
-            return VAL
-
-        if elem == pulldom.START_DOCUMENT: # Ignore
-            return self.read() 
-
-        if elem == pulldom.END_DOCUMENT:
-            return None # done
-
-        assert False # Unexpected
+    def keys(self):
+        return list(self.iterkeys())
+
+    def values(self):
+        return list(self.itervalues())
 
 MESSAGE = "MESSAGE"
 RESULT = "RESULT"
 RESULTS = "RESULTS"
 class ResultsReader:
-    """A forward-only, streaming search results reader."""
-    def __init__(self, stream):
-        self._reader = XMLReader(stream)
+    """A forward-only, streaming search results reader. If a list of fields
+       is given, results (and the section field order) are projected onto 
+       those fields, any other fields are skipped without being loaded.
+       Results are dicts, or if compact is True, Rows that share their
+       section's field names, which takes less memory where many results
+       are kept."""
+    def __init__(self, stream, fields=None, compact=False):
+        self._items = self._parse(XMLStream(stream))
+        self._project = None if fields is None else set(fields)
+        self._compact = compact
+        self._schema = Schema(["$offset"]) # The current section's schema
         self.kind = None
         self.value = None
         self.fields = None
@@ -236,125 +302,143 @@ class ResultsReader:
     def __iter__(self):
         return self
 
-    def _checktag(self, name = None):
-        if not self._istag(name): 
-            self._error() 
-
-    def _checkend(self, name = None):
-        if not self._isend(name): 
-            self._error()
-    
-    def _checkval(self):
-        if (not self._isval() and not self._isend()): 
-            self._error()
-
-    def _error(self):
-        raise Exception, "Unexpected item: %s" % repr(self._reader.item)
-
-    def _istag(self, name = None):
-        return self._reader.istag(name)
-
-    def _isend(self, name = None):
-        return self._reader.isend(name)
-
-    def _isval(self):
-        return self._reader.isval()
-
-    def _read_message(self):
-        type_ = self._reader.attrs["type"]
-        message = self._scanval()
-        self._scanend("msg")
-        self.kind = MESSAGE
-        self.value = {'type': type_, 'message': message }
-        return MESSAGE
-
-    def _read_meta(self):
-        self._scantag("fieldOrder")
-        while True:
-            self._scan()
-            if self._isend("fieldOrder"): 
-                break
-            self._checktag("field")
-            value = self._scanval()
-            self.fields.append(value)
-            self._scanend("field")
-        self._scanend("meta")
-
-    # Reads a single search result record.
-    def _read_result(self):
-        result = {}
-        offset = self._reader.attrs['offset'].encode("utf8")
+    def batches(self, size=DEFAULT_BATCHSIZE, arrays=False):
+        """Reads the remaining results in column form, yielding batches of
+           up to size results as a dict of field name => column, ie: the 
+           list of the field's values, one per result (None where a result
+           lacks the field). There is a column for each field in the 
+           section's field order, and for any other field (eg: '$offset')
+           as soon as it is seen. A new results section starts a new batch.
+           If arrays is True, columns are NumPy arrays instead, converted to
+           int64 or float64 where every value is numeric (requires NumPy).
+           Messages are skipped."""
+        if arrays and numpy is None:
+            raise ImportError, "batches(arrays=True) requires numpy"
+        columns, count = None, 0
         while True:
-            self._scan()
-
-            if self._isend("result"): 
-                break
-
-            self._checktag("field")
-            key = self._reader.attrs["k"].encode("utf8")
-            name = self._scantag()
-
-            if name == "v":
-                result[key] = self._reader.expand().toxml("utf8")
-                self._scanend("field")
-            elif name == "value":
-                result[key] = self._read_value()
-                self._checkend("field")
-            else: self._error()
-
-        self.kind = RESULT
-        result['$offset'] = offset
-        self.value = result
-        return RESULT
-
-    # Reads the results section header and metadata
-    def _read_results(self):
-        self.fields = []
-        self.kind = RESULTS
-        self.value = self._reader.attrs
-        self._scantag("meta")
-        self._read_meta()
-        return RESULTS
-
-    # Reads a field value, handle single and multi-valied fields.
-    def _read_value(self):
+            kind = self.read()
+            if kind == RESULT:
+                if columns is None:
+                    columns = dict([(field, []) for field in self.fields])
+                for key, value in self.value.iteritems():
+                    column = columns.get(key, None)
+                    if column is None:
+                        column = columns[key] = [None] * count
+                    column.append(value)
+                count += 1
+                for column in columns.itervalues():
+                    if len(column) < count: column.append(None)
+                if count < size: continue
+            elif kind == MESSAGE: 
+                continue
+            if columns is not None:
+                if arrays:
+                    for key, column in columns.iteritems(): 
+                        columns[key] = _array(column)
+                yield columns
+                columns, count = None, 0
+            if kind is None: return
+
+    def _error(self, event, element):
+        item = (event, _qname(element.tag))
+        raise Exception, "Unexpected item: %s" % repr(item)
+
+    # Parse the given stream, yielding (kind, value) for each item. Each 
+    # message & result element is loaded once complete and then discarded
+    # so that memory use does not grow with the size of the results.
+    def _parse(self, stream):
+        stack = []      # Elements currently open
+        inner = None    # The open message, meta or result element
+        results = None  # The attrs of the current results section
+        pending = False # The results section header is yet to be read
+        for event, element in iterparse(stream, ("start", "end")):
+            if event == "start":
+                stack.append(element)
+                if inner is not None: continue
+                tag = element.tag
+                if tag in ["meta", "msg", "result"]:
+                    inner = element
+                elif tag == "results":
+                    results = dict(element.attrib) or None
+                    pending = True
+                    self.fields = []
+                    self._schema = Schema(["$offset"])
+                elif tag not in OUTER:
+                    self._error(event, element)
+                continue
+
+            stack.pop()
+            if element is not inner:
+                if element.tag == "results" and pending:
+                    pending = False
+                    yield RESULTS, results # No meta section
+                continue
+            inner = None
+
+            tag = element.tag
+            if tag == "result":
+                item = RESULT, self._load_result(element)
+            elif tag == "msg":
+                item = MESSAGE, {
+                    'type': element.attrib["type"], 
+                    'message': _text(element) }
+            else: # meta
+                self._load_meta(element)
+                item = RESULTS, results
+                pending = False
+            if stack: stack[-1].remove(element)
+            yield item
+
+    # Loads the section's field order. Names are UTF-8 encoded, as result
+    # field names are, so that they match the keys of the section's rows.
+    def _load_meta(self, element):
+        fieldorder = element.find("fieldOrder")
+        if fieldorder is None: return
+        for field in fieldorder.findall("field"):
+            name = _utf8(_text(field))
+            if self._project is None or name in self._project:
+                self.fields.append(name)
+                self._schema.add(name)
+
+    # Loads a single search result record as a dict, or as a Row of the
+    # section's schema if the reader is compact.
+    def _load_result(self, element):
+        schema = self._schema
+        project = self._project
+        result = [None] * len(schema.names)
+        result[0] = _utf8(element.attrib['offset']) # $offset
+        for field in element:
+            if field.tag != "field": self._error("start", field)
+            key = _utf8(field.attrib["k"])
+            if project is not None and key not in project: continue
+            index = schema.index.get(key, None)
+            if index is None: 
+                index = schema.add(key)
+                result.append(None)
+            values = list(field)
+            if len(values) == 0: self._error("end", field)
+            if values[0].tag == "v":
+                result[index] = _toxml(values[0])
+            elif values[0].tag == "value":
+                result[index] = self._load_value(values)
+            else: 
+                self._error("start", values[0])
+        if self._compact: return Row(schema, result)
+        return dict([(name, value)
+                     for name, value in izip(schema.names, result)
+                     if value is not None])
+
+    # Loads a field value, handle single and multi-valued fields.
+    def _load_value(self, elements):
         value = []
-        while True:
-            self._checktag("value")
-            self._scantag("text")
-            val = self._scanval()
-
-            if val:
-                value.append(val.encode("utf8"))
-                self._scanend("text")
-            else:
-                value.append("")
-                
-            self._scanend("value")
-            self._scan()
-            if self._isend("field"): 
-                break
+        for element in elements:
+            if element.tag != "value": self._error("start", element)
+            text = element.find("text")
+            if text is None: self._error("end", element)
+            text = _text(text)
+            value.append("" if text is None else _utf8(text))
         return value[0] if len(value) == 1 else value
 
-    def _scan(self):
-        self._reader.read()
-        return self._reader.kind
-
-    def _scantag(self, name = None):
-        self._reader.read()
-        self._checktag(name)
-        return self._reader.name
-
-    def _scanend(self, name = None):
-        self._reader.read()
-        self._checkend(name)
-        return self._reader.name
-
-    def _scanval(self):
-        self._reader.read()
-        self._checkval()
-        return self._reader.value
-
     @property
     def item(self):
         return (self.kind, self.value)
@@ -365,37 +449,11 @@ class ResultsReader:
             raise StopIteration()
         return self.item
 
-    # Read the next search result, handling new sections and section metadata 
-    # as necessarry. NOTE: if the pulldom reader raises StopIteration, we 
-    # simply pass that through to indicate the end of our iterable.
+    # Read the next search result, message or results section header and 
+    # return its kind, or None at the end of the stream.
     def read(self):
-        while True:
-            kind = self._scan()
-
-            if kind == TAG:
-                name = self._reader.name
-                if name == "result":
-                    return self._read_result()
-                if name == "msg":
-                    return self._read_message()
-                if name == "results":
-                    return self._read_results()
-                if name == "messages":
-                    continue # Ignore the 'messages' wrapper, we dont validate
-                if name == "doc":
-                    continue # Skip synthetic root element
-
-            if kind == END:
-                name = self._reader.name
-                if name == "results":
-                    continue
-                if name == "messages":
-                    continue # Keep looking for results
-                if name == "doc":
-                    continue # Skip synthetic root end-element
-
-            if kind is None: 
-                return None
-
-            self._error()
-
+        try:
+            self.kind, self.value = self._items.next()
+        except StopIteration:
+            self.kind = self.value = None
+        return self.kind
@@ -0,0 +1,177 @@
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Retries and circuit breaking for the binding layer, see
+   splunk.binding.HttpLib."""
+
+import httplib
+import random
+import socket
+import threading
+from time import sleep, time
+
+from splunk.pool import spliturl
+
+__all__ = [
+    "CircuitOpenError",
+    "RetryPolicy",
+]
+
+# Requests that may be replayed after an expired session is renewed
+IDEMPOTENT_METHODS = ["DELETE", "GET", "HEAD", "OPTIONS", "PUT"]
+
+# Endpoints whose POST requests only read state, and so may also be retried
+IDEMPOTENT_ENDPOINTS = ["auth/login", "search/jobs/export", "search/parser"]
+
+class CircuitOpenError(Exception):
+    """Raised instead of issuing a request to a host that has been failing,
+       until the host's circuit breaker lets a trial request through."""
+    pass
+
+# Tracks consecutive failures of a host. After threshold failures in a row
+# the circuit opens and requests fail fast for cooldown seconds, after which
+# a single trial request is let through: its success closes the circuit and
+# its failure opens it again.
+class CircuitBreaker(object):
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None # Time the circuit opened, None if closed
+        self._trial = False # A trial request is in flight
+        self._lock = threading.Lock()
+
+    # Raises CircuitOpenError unless a request may be issued, answers if
+    # the request is the trial, which must then be released once it is done.
+    def check(self, host):
+        with self._lock:
+            if self.opened is None: return False
+            if not self._trial and time() - self.opened >= self.cooldown:
+                self._trial = True
+                return True
+        raise CircuitOpenError("Circuit open for %s" % host)
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.threshold: self.opened = time()
+
+    # Let another trial through if the trial ended with neither a success
+    # nor a failure, eg: it was interrupted.
+    def release(self):
+        with self._lock:
+            self._trial = False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened = None
+            self._trial = False
+
+class RetryPolicy(object):
+    """Retries requests that fail with a socket error or a 5xx status in
+       statuses, at most retries times, waiting between attempts with
+       exponential backoff and full jitter (or as long as a 503's
+       Retry-After asks, up to maxdelay). Only idempotent requests, by
+       method or endpoint, are retried. Every request adds budget to a
+       shared retry budget (capped at budgetmax) and every retry spends 1
+       from it, so retries stay a small fraction of the traffic when the
+       service is struggling; a budget of None disables this. Hosts that
+       keep failing get their circuit opened, see CircuitOpenError."""
+    def __init__(self, retries=3, backoff=0.5, maxdelay=30,
+                 budget=0.2, budgetmax=10, threshold=5, cooldown=30,
+                 statuses=(500, 502, 503, 504)):
+        self.retries = retries
+        self.backoff = backoff
+        self.maxdelay = maxdelay
+        self.budget = budget
+        self.budgetmax = budgetmax
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.statuses = statuses
+        self._balance = budgetmax
+        self._breakers = {} # (scheme, host, port) => CircuitBreaker
+        self._lock = threading.Lock()
+
+    def _breaker(self, key):
+        with self._lock:
+            breaker = self._breakers.get(key, None)
+            if breaker is None:
+                breaker = CircuitBreaker(self.threshold, self.cooldown)
+                self._breakers[key] = breaker
+            return breaker
+
+    def _deposit(self):
+        if self.budget is None: return
+        with self._lock:
+            self._balance = min(self.budgetmax, self._balance + self.budget)
+
+    def _withdraw(self):
+        if self.budget is None: return True
+        with self._lock:
+            if self._balance < 1: return False
+            self._balance -= 1
+            return True
+
+    def call(self, method, url, func, *args, **kwargs):
+        """Call func(*args, **kwargs), which issues the given request,
+           retrying according to the policy."""
+        scheme, host, port, path = spliturl(url)
+        breaker = self._breaker((scheme, host, port))
+        retryable = self.retryable(method, path)
+        self._deposit()
+        attempt = 0
+        while True:
+            trial = breaker.check("%s:%s" % (host, port))
+            try:
+                response = func(*args, **kwargs)
+            except Exception as e:
+                if not self.failed(e):
+                    breaker.success() # The host is up, the request is bad
+                    raise
+                breaker.failure()
+                if not retryable or attempt >= self.retries: raise
+                if not self._withdraw(): raise
+                sleep(self.delay(attempt, e))
+                attempt += 1
+                continue
+            finally:
+                if trial: breaker.release()
+            breaker.success()
+            return response
+
+    def delay(self, attempt, error):
+        """Returns the number of seconds to wait before the given retry."""
+        if getattr(error, "status", None) == 503: # See HTTPError
+            value = dict(error.headers).get("retry-after", None)
+            if value is not None and value.strip().isdigit():
+                return min(self.maxdelay, int(value))
+        return random.uniform(0, min(self.maxdelay, self.backoff * 2**attempt))
+
+    def failed(self, error):
+        """Answers if the given error indicates a failed (rather than
+           rejected) request, ie: one worth retrying."""
+        status = getattr(error, "status", None) # See HTTPError
+        if status is not None: return status in self.statuses
+        return isinstance(error, (socket.error, httplib.HTTPException))
+
+    def retryable(self, method, path):
+        """Answers if a request with the given method and path may be
+           issued more than once."""
+        if method in IDEMPOTENT_METHODS: return True
+        path = path.split('?', 1)[0].rstrip('/')
+        for endpoint in IDEMPOTENT_ENDPOINTS:
+            if path.endswith("/" + endpoint): return True
+        return False
@@ -0,0 +1,132 @@
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Request timing statistics, see splunk.binding.Context.instrument."""
+
+import math
+import threading
+
+from splunk.data import record
+
+__all__ = [
+    "RequestStats",
+]
+
+# Replace the variable segments of the given REST path (namespace, search
+# ids, numeric ids) with placeholders so that timings can be grouped by
+# endpoint, eg: /servicesNS/admin/search/search/jobs/1234.5/results becomes
+# /servicesNS/{owner}/{app}/search/jobs/{sid}/results.
+def template(path):
+    segments = path.split('?', 1)[0].split('/')
+    if len(segments) > 3 and segments[1] == "servicesNS":
+        segments[2], segments[3] = "{owner}", "{app}"
+    for i, segment in enumerate(segments):
+        if i > 1 and segments[i-2:i] == ["search", "jobs"] and \
+           segment not in ["export", "oneshot"]:
+            segments[i] = "{sid}"
+        elif segment.isdigit():
+            segments[i] = "{id}"
+    return '/'.join(segments)
+
+# A histogram of durations over logarithmic buckets, each 2**(1/4) wider
+# than the last, so percentiles are accurate to within ~10% in constant
+# space regardless of the number of samples.
+class Histogram(object):
+    BASE = 1e-4 # Upper bound of the first bucket (seconds)
+    GROWTH = 2 ** 0.25
+
+    def __init__(self):
+        self.buckets = {} # bucket index => count
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        index = 0
+        if value > self.BASE:
+            index = int(math.ceil(math.log(value / self.BASE, self.GROWTH)))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """Returns the upper bound of the bucket holding the p'th percentile
+           (0 < p <= 100), never more than the largest value added."""
+        if self.count == 0: return 0.0
+        rank = math.ceil(self.count * p / 100.0)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank: break
+        return min(self.max, self.BASE * self.GROWTH ** index)
+
+class RequestStats(object):
+    """A thread-safe request timing aggregator, for use as a listener with
+       Context.instrument. Requests are grouped by method and templated
+       path; each group keeps a count, error count (status >= 400), bytes
+       sent & received, connections opened and a Histogram of each phase
+       (connect, tls, ttfb, body, total)."""
+    PHASES = ["connect", "tls", "ttfb", "body", "total"]
+
+    def __init__(self):
+        self.groups = {} # (method, path) => record
+        self._lock = threading.Lock()
+
+    def __call__(self, timing):
+        key = (timing.method, timing.path)
+        with self._lock:
+            group = self.groups.get(key, None)
+            if group is None:
+                group = record({
+                    'count': 0, 'errors': 0, 'sent': 0, 'received': 0,
+                    'connections': 0 })
+                for phase in self.PHASES: group[phase] = Histogram()
+                self.groups[key] = group
+            group.count += 1
+            if timing.status >= 400: group.errors += 1
+            if not timing.reused: group.connections += 1
+            group.sent += timing.sent
+            group.received += timing.received
+            for phase in self.PHASES: group[phase].add(timing[phase])
+
+    def clear(self):
+        with self._lock: self.groups = {}
+
+    def report(self, percentiles=(50, 90, 99)):
+        """Returns a list of summary records, one per request group and
+           slowest (by total time) first, with the fields: method, path,
+           count, errors, sent, received, connections and, for each phase,
+           a record of mean, max and the given percentiles (named p50 ..)."""
+        with self._lock:
+            result = []
+            for (method, path), group in self.groups.iteritems():
+                summary = record({
+                    'method': method, 'path': path, 'count': group.count,
+                    'errors': group.errors, 'sent': group.sent,
+                    'received': group.received,
+                    'connections': group.connections })
+                for phase in self.PHASES:
+                    histogram = group[phase]
+                    stats = record({
+                        'mean': histogram.mean(), 'max': histogram.max })
+                    for p in percentiles:
+                        stats["p%s" % p] = histogram.percentile(p)
+                    summary[phase] = stats
+                result.append(summary)
+        result.sort(key=lambda s: s.total.mean * s.count, reverse=True)
+        return result
@@ -14,4 +14,8 @@ password=changed
 scheme=https
 
 # Namespace to use (OPTIONAL)
-namespace=*:*
\ No newline at end of file
+namespace=*:*
+
+# File in which to cache session tokens between runs, so that each run does
+# not have to log in again (OPTIONAL)
+tokencache=~/.splunktokens
\ No newline at end of file
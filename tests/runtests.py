@@ -23,6 +23,8 @@ os.environ["COVERAGE_PROCESS_START"] = "../tests/.coveragerc"
 
 files = [
     "test_data.py",
+    "test_results.py",
+    "test_ingest.py",
     "test_binding.py",
     "test_client.py",
     "test_examples.py",
@@ -12,18 +12,30 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import gzip
+import httplib
+import os
 from os import path
+import shutil
+import socket
 from StringIO import StringIO
+import struct
 import sys
+import tempfile
+import threading
+from time import sleep
+import traceback
 import unittest
 import urllib2
 import uuid
+import zlib
 from xml.etree import ElementTree
 from xml.etree.ElementTree import XML
 
 import splunk.binding as binding
 from splunk.binding import HTTPError
 import splunk.data as data
+from splunk.stats import Histogram
 
 from utils import parse
 
@@ -98,11 +110,422 @@ class ModuleTestCase(unittest.TestCase):
             "splunk.binding",
             "splunk.client",
             "splunk.data",
-            "splunk.results"
+            "splunk.executor",
+            "splunk.ingest",
+            "splunk.pool",
+            "splunk.results",
+            "splunk.retry",
+            "splunk.stats"
         ]
         for module in modules:
             self.assertTrue(check_module(module, module + ".baseline"))
 
+class ResponseReaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.text = "".join(["line %d\n" % i for i in range(50000)])
+
+    def assertDecoded(self, body, encoding):
+        reader = binding.ResponseReader(StringIO(body), encoding=encoding)
+        chunks = []
+        while True:
+            chunk = reader.read(4096)
+            self.assertTrue(len(chunk) <= 4096)
+            if len(chunk) == 0: break
+            chunks.append(chunk)
+        self.assertEqual("".join(chunks), self.text)
+
+        reader = binding.ResponseReader(StringIO(body), encoding=encoding)
+        self.assertEqual(reader.read(10) + reader.read(), self.text)
+        self.assertEqual(reader.read(), "")
+
+    def test_deflate(self):
+        self.assertDecoded(zlib.compress(self.text), "deflate")
+
+    def test_gzip(self):
+        buffer = StringIO()
+        file = gzip.GzipFile(fileobj=buffer, mode="wb")
+        file.write(self.text)
+        file.close()
+        self.assertDecoded(buffer.getvalue(), "gzip")
+
+    def test_identity(self):
+        self.assertDecoded(self.text, None)
+        self.assertDecoded(self.text, "identity")
+
+# Returns a request handler that fails with the given status the given
+# number of times before succeeding, and the list of requests it received.
+def flaky_handler(failures, status=503):
+    requests = []
+    def handler(url, message, **kwargs):
+        requests.append((message['method'], url))
+        if len(requests) <= failures:
+            body = "<response><messages><msg>busy</msg></messages></response>"
+            return {
+                'status': status, 
+                'reason': "Busy",
+                'headers': [("retry-after", "0")], 
+                'body': StringIO(body),
+            }
+        return {
+            'status': 200, 'reason': "OK", 'headers': [], 'body': StringIO()
+        }
+    return handler, requests
+
+class RetryPolicyTestCase(unittest.TestCase):
+    def policy(self, **kwargs):
+        return binding.RetryPolicy(backoff=0.001, **kwargs)
+
+    def test_retry(self):
+        handler, requests = flaky_handler(2)
+        http = binding.HttpLib(handler, self.policy())
+        self.assertEqual(http.get("http://localhost:8089/services").status, 200)
+        self.assertEqual(len(requests), 3)
+
+    def test_idempotent(self):
+        handler, requests = flaky_handler(1)
+        http = binding.HttpLib(handler, self.policy())
+        self.assertRaises(HTTPError, 
+            http.post, "http://localhost:8089/services/search/jobs")
+        self.assertEqual(len(requests), 1)
+
+        # Read-only endpoints may be retried whatever the method
+        handler, requests = flaky_handler(1)
+        http = binding.HttpLib(handler, self.policy())
+        http.post("http://localhost:8089/services/search/jobs/export")
+        self.assertEqual(len(requests), 2)
+
+    def test_status(self):
+        handler, requests = flaky_handler(1, 404)
+        http = binding.HttpLib(handler, self.policy())
+        self.assertRaises(HTTPError, http.get, "http://localhost:8089/x")
+        self.assertEqual(len(requests), 1)
+
+    def test_budget(self):
+        handler, requests = flaky_handler(10)
+        http = binding.HttpLib(handler, self.policy(budget=0.1, budgetmax=2))
+        self.assertRaises(HTTPError, http.get, "http://localhost:8089/x")
+        self.assertEqual(len(requests), 3) # Only 2 retries in the budget
+
+    def test_circuit(self):
+        handler, requests = flaky_handler(10)
+        http = binding.HttpLib(handler, 
+            self.policy(retries=0, threshold=2, cooldown=60))
+        for i in range(2):
+            self.assertRaises(HTTPError, http.get, "http://localhost:8089/x")
+        self.assertRaises(binding.CircuitOpenError, 
+            http.get, "http://localhost:8089/x")
+        self.assertEqual(len(requests), 2)
+
+    def test_interrupted_trial(self):
+        handler, requests = flaky_handler(2)
+        def interrupted(url, message, **kwargs):
+            if len(requests) == 2: # The trial request
+                requests.append((message['method'], url))
+                raise KeyboardInterrupt
+            return handler(url, message, **kwargs)
+        http = binding.HttpLib(interrupted,
+            self.policy(retries=0, threshold=2, cooldown=0))
+        for i in range(2):
+            self.assertRaises(HTTPError, http.get, "http://localhost:8089/x")
+        self.assertRaises(KeyboardInterrupt,
+            http.get, "http://localhost:8089/x")
+        # The next request is let through as a new trial
+        self.assertEqual(http.get("http://localhost:8089/x").status, 200)
+
+def timing(path, status=200, total=0.01, reused=True):
+    return data.record({
+        'method': "GET", 'url': "http://localhost:8089" + path,
+        'path': binding.template(path), 'status': status, 'sent': 100, 
+        'received': 1000, 'reused': reused, 'connect': 0.0, 'tls': 0.0,
+        'ttfb': total / 2, 'body': total / 2, 'total': total })
+
+class RequestStatsTestCase(unittest.TestCase):
+    def test_template(self):
+        template = binding.template
+        self.assertEqual(
+            template("/servicesNS/admin/search/search/jobs/1318.5/results"),
+            "/servicesNS/{owner}/{app}/search/jobs/{sid}/results")
+        self.assertEqual(
+            template("/services/search/jobs/export?search=x"),
+            "/services/search/jobs/export")
+        self.assertEqual(
+            template("/services/receivers/simple/42"), 
+            "/services/receivers/simple/{id}")
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        for i in range(1, 1001): histogram.add(i / 1000.0)
+        self.assertEqual(histogram.count, 1000)
+        self.assertEqual(histogram.max, 1.0)
+        self.assertAlmostEqual(histogram.mean(), 0.5005)
+        for p in [50, 90, 99]:
+            value = histogram.percentile(p)
+            self.assertTrue(p / 100.0 <= value <= p / 100.0 * 1.2)
+        self.assertEqual(histogram.percentile(100), 1.0)
+
+    def test_report(self):
+        stats = binding.RequestStats()
+        for i in range(10): stats(timing("/services/search/jobs/%d" % i))
+        stats(timing("/services/search/jobs/x", 404, reused=False))
+        stats(timing("/services/apps/local", total=0.5))
+        report = stats.report()
+        self.assertEqual(len(report), 2)
+        self.assertEqual(report[0].path, "/services/apps/local")
+        jobs = report[1]
+        self.assertEqual(jobs.path, "/services/search/jobs/{sid}")
+        self.assertEqual(jobs.count, 11)
+        self.assertEqual(jobs.errors, 1)
+        self.assertEqual(jobs.connections, 1)
+        self.assertEqual(jobs.received, 11000)
+        self.assertAlmostEqual(jobs.total.mean, 0.01)
+        self.assertTrue(jobs.total.p50 <= jobs.total.p99 <= 0.01)
+
+# A local HTTP server that answers each request with an empty 200 response,
+# except for the requests whose (1-based) numbers are in drops, which it
+# reads the head of and then resets the connection instead of answering.
+class Server(object):
+    def __init__(self, drops=()):
+        self.drops = drops
+        self.requests = [] # The (method, path) of each request read
+        self.connections = 0
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(5)
+        self.listener.settimeout(0.05)
+        self.url = "http://127.0.0.1:%d" % self.listener.getsockname()[1]
+        self.stopping = False
+        self.thread = threading.Thread(target=self.accept)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def accept(self):
+        while not self.stopping:
+            try:
+                connection, address = self.listener.accept()
+            except socket.timeout:
+                continue
+            self.connections += 1
+            thread = threading.Thread(target=self.serve, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def serve(self, connection):
+        connection.settimeout(None)
+        file = connection.makefile("rb")
+        while True:
+            line = file.readline()
+            if not line: break
+            headers = {}
+            while True:
+                header = file.readline().rstrip("\r\n")
+                if not header: break
+                key, value = header.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+            self.requests.append(tuple(line.split()[:2]))
+            if len(self.requests) in self.drops:
+                linger = struct.pack("ii", 1, 0) # Reset on close
+                connection.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_LINGER, linger)
+                break
+            if headers.get("transfer-encoding", None) == "chunked":
+                while True:
+                    size = int(file.readline(), 16)
+                    file.read(size + 2)
+                    if size == 0: break
+            else:
+                file.read(int(headers.get("content-length", 0)))
+            connection.sendall(
+                "HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+        file.close()
+        connection.close()
+
+    def close(self):
+        self.stopping = True
+        self.thread.join()
+        self.listener.close()
+
+class ExecutorTestCase(unittest.TestCase):
+    def test_cancel(self):
+        # Only calls that have not started can be cancelled
+        started, release = threading.Event(), threading.Event()
+        calls = []
+        def call(value):
+            calls.append(value)
+            started.set()
+            release.wait()
+            return value
+        executor = binding.Executor(1)
+        try:
+            running = executor.submit(call, 1)
+            queued = executor.submit(call, 2)
+            started.wait()
+            self.assertFalse(running.cancel())
+            self.assertTrue(queued.cancel())
+            self.assertTrue(queued.done() and queued.cancelled())
+            self.assertRaises(RuntimeError, queued.result)
+            release.set()
+            self.assertEqual(running.result(), 1)
+            self.assertFalse(running.cancelled())
+        finally:
+            release.set()
+            executor.shutdown()
+        self.assertEqual(calls, [1])
+
+class HandlerTestCase(unittest.TestCase):
+    def test_observe(self):
+        # Handlers that don't take the observe kwarg still work when the
+        # library is instrumented, without timings.
+        handler, requests = flaky_handler(0)
+        def plain(url, message):
+            return handler(url, message)
+        timings = []
+        for custom in [plain, handler]:
+            http = binding.HttpLib(custom)
+            http.instrument(timings.append)
+            self.assertEqual(http.get("http://localhost:8089/x").status, 200)
+        self.assertEqual(len(requests), 2)
+
+    def test_arguments(self):
+        # Query arguments may share names with the context's internals
+        handler, requests = flaky_handler(0)
+        context = binding.Context(handler=handler)
+        response = context.get("x", method="m", func="f")
+        self.assertEqual(response.status, 200)
+        self.assertTrue("method=m" in requests[0][1])
+        self.assertTrue("func=f" in requests[0][1])
+
+        context = binding.AsyncContext(handler=handler, workers=1)
+        try:
+            future = context.get("x", func="f")
+            self.assertEqual(future.result(5).status, 200)
+        finally:
+            context.close()
+        self.assertTrue("func=f" in requests[1][1])
+
+    def test_futures(self):
+        # A failed request's error is raised with its original traceback
+        handler, requests = flaky_handler(1, 404)
+        context = binding.Context(handler=handler)
+        futures = context._futures([("GET", "x"), ("GET", "y")], 1)
+        self.assertEqual(futures[1].result(5).status, 200)
+        try:
+            futures[0].result()
+            self.fail("Expected HTTPError")
+        except HTTPError:
+            frames = traceback.extract_tb(sys.exc_info()[2])
+        self.assertTrue("_call" in [frame[2] for frame in frames])
+        context.close()
+
+    def test_reconnect(self):
+        # An idempotent request is retried once when a pooled connection
+        # turns out to have been dropped.
+        server = Server(drops=[2])
+        http = binding.HttpLib()
+        try:
+            for i in range(2):
+                self.assertEqual(http.get(server.url + "/x").status, 200)
+        finally:
+            server.close()
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(server.connections, 2)
+
+        # Other requests may already have taken effect, so are not retried
+        server = Server(drops=[2])
+        http = binding.HttpLib()
+        try:
+            http.get(server.url + "/x")
+            self.assertRaises((socket.error, httplib.HTTPException),
+                              http.post, server.url + "/x", body="event")
+        finally:
+            server.close()
+        self.assertEqual(server.requests, [("GET", "/x"), ("POST", "/x")])
+
+    def test_streamed(self):
+        # A streamed body is never resent, even if the connection dropped
+        # before any of it was sent, since part of it has been consumed.
+        def body():
+            sleep(0.2) # Let the server reset the connection first
+            for i in range(3): yield "event %d\n" % i
+        server = Server(drops=[2])
+        http = binding.HttpLib()
+        try:
+            http.get(server.url + "/x")
+            message = { 'method': "PUT", 'headers': [], 'body': body() }
+            self.assertRaises((socket.error, httplib.HTTPException),
+                              http.request, server.url + "/x", message)
+        finally:
+            server.close()
+        self.assertEqual(server.requests, [("GET", "/x"), ("PUT", "/x")])
+
+    def test_batch(self):
+        # Batches share the context's workers and pooled connections
+        server = Server()
+        context = binding.Context(
+            host="127.0.0.1", port=server.url.rsplit(":", 1)[1],
+            scheme="http")
+        context.token = "Splunk token"
+        try:
+            for i in range(3):
+                responses = context.map("GET", ["/x"] * 10, concurrency=3)
+                self.assertEqual([r.status for r in responses], [200] * 10)
+            self.assertTrue(server.connections <= 3)
+
+            # A batch issued from the context's own workers runs inline,
+            # rather than waiting on requests queued behind it
+            executor = context.executor(3) # As many batches as workers
+            futures = [executor.submit(context.map, "GET", ["/x"] * 4, 2)
+                       for i in range(3)]
+            for future in futures:
+                self.assertEqual(
+                    [r.status for r in future.result(5)], [200] * 4)
+            workers = context.executor()._threads
+            self.assertTrue(0 < len(workers) <= 3)
+            context.close()
+            for worker in workers: self.assertFalse(worker.is_alive())
+        finally:
+            server.close()
+
+class TokenCacheTestCase(unittest.TestCase):
+    def test_save(self):
+        directory = tempfile.mkdtemp()
+        filepath = path.join(directory, "tokens")
+        try:
+            cache = binding.TokenCache(filepath)
+            cache.set("key", "Splunk token")
+            self.assertEqual(cache.get("key"), "Splunk token")
+            self.assertEqual(os.stat(filepath).st_mode & 0777, 0600)
+            self.assertEqual(os.listdir(directory), ["tokens"]) # No temps
+
+            cache.set("other", "Splunk other") # Replaces the file
+            self.assertEqual(cache.get("key"), "Splunk token")
+            self.assertEqual(os.stat(filepath).st_mode & 0777, 0600)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_threads(self):
+        # Caches of the same file, eg: one per Context, save in turn
+        directory = tempfile.mkdtemp()
+        filepath = path.join(directory, "tokens")
+        errors = []
+        def save(n):
+            cache = binding.TokenCache(filepath)
+            try:
+                for i in range(100): cache.set("key%d" % n, "Splunk %d" % i)
+            except Exception as e:
+                errors.append(e)
+        try:
+            threads = [threading.Thread(target=save, args=(n,))
+                       for n in range(4)]
+            for thread in threads: thread.start()
+            for thread in threads: thread.join()
+            self.assertEqual(errors, [])
+            cache = binding.TokenCache(filepath)
+            for n in range(4):
+                self.assertEqual(cache.get("key%d" % n), "Splunk 99")
+            self.assertEqual(os.listdir(directory), ["tokens"])
+        finally:
+            shutil.rmtree(directory)
+
 def isatom(body):
     """Answers if the given response body looks like ATOM."""
     root = XML(body)
@@ -133,6 +556,32 @@ class ProtocolTestCase(unittest.TestCase):
                 body = context.get(path).body.read()
                 self.assertTrue(isatom(body))
     
+class AsyncTestCase(unittest.TestCase):
+    def test(self):
+        global opts
+
+        paths = [
+            "/services", 
+            "authentication/users", 
+            "search/jobs"
+        ]
+
+        context = binding.AsyncContext(**opts.kwargs)
+        try:
+            self.assertTrue(context.login().result() is context)
+
+            # Issue all requests before waiting on any of them
+            futures = [context.get(path) for path in paths]
+            for future in futures:
+                self.assertTrue(isatom(future.result().body.read()))
+
+            # Errors are raised when the result is requested
+            future = context.get("/services/__unknown__")
+            self.assertEqual(future.exception().status, 404)
+            self.assertRaises(HTTPError, future.result)
+        finally:
+            context.close()
+
 class BindingTestCase(unittest.TestCase): # Base class
     def setUp(self):
         global opts
@@ -190,6 +639,106 @@ class BindingTestCase(unittest.TestCase): # Base class
         # Just check to make sure the service is alive
         self.assertEqual(self.get("/services").status, 200)
 
+    def test_autologin(self):
+        context = binding.connect(autologin=True, **opts.kwargs)
+        context.token = "Splunk invalid" # Simulate an expired session
+        response = context.get("/services")
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(context.token, "Splunk invalid")
+
+        # Non-idempotent requests are not replayed
+        context.token = "Splunk invalid"
+        self.assertHttp(401, context.post, PATH_USERS)
+        self.assertNotEqual(context.token, "Splunk invalid")
+
+    def test_batch(self):
+        requests = [
+            ("GET", "/services"),
+            ("GET", PATH_USERS, { 'count': -1 }),
+            ("GET", "/services/__unknown__"),
+        ]
+        responses = self.context.batch(requests, concurrency=2)
+        self.assertEqual(len(responses), 3)
+        self.assertTrue(isatom(responses[0].body.read()))
+        self.assertTrue(isatom(responses[1].body.read()))
+        self.assertTrue(isinstance(responses[2], HTTPError))
+        self.assertEqual(responses[2].status, 404)
+
+        responses = self.context.map("GET", ["/services", PATH_USERS])
+        for response in responses: 
+            self.assertTrue(isatom(response.body.read()))
+
+    def test_keepalive(self):
+        # Count the connections the pooled handler opens
+        pool = self.context.http.handler.pool
+        connect = pool.connect
+        connects = []
+        def counted(*args):
+            connects.append(args)
+            return connect(*args)
+        pool.connect = counted
+        pool.clear()
+
+        for i in range(5): self.get("/services").body.read()
+        self.assertEqual(len(connects), 1)
+
+    def test_instrument(self):
+        stats = self.context.instrument(binding.RequestStats())
+        timings = []
+        self.context.instrument(timings.append)
+        for i in range(3): self.get("/services").body.read()
+        self.assertEqual(len(timings), 3)
+        for timing in timings:
+            self.assertEqual(timing.status, 200)
+            self.assertTrue(timing.received > 0)
+            self.assertTrue(timing.ttfb <= timing.total)
+        report = stats.report()
+        self.assertEqual(report[0].path, "/services")
+        self.assertEqual(report[0].count, 3)
+
+    def test_streaming(self):
+        path = "receivers/simple"
+
+        # An iterable body is sent with chunked transfer encoding
+        chunks = ["%s streamed event\n" % uname() for i in range(3)]
+        response = self.context.post(path, body=iter(chunks))
+        self.assertEqual(response.status, 200)
+
+        # A file body is sent with its length
+        file = tempfile.TemporaryFile()
+        file.write("".join(chunks))
+        file.seek(0)
+        response = self.context.request(path, {'method': "POST", 'body': file})
+        self.assertEqual(response.status, 200)
+
+        self.assertTrue(binding.replayable("event"))
+        self.assertFalse(binding.replayable(file))
+
+    def test_tokencache(self):
+        filepath = path.join(tempfile.gettempdir(), uname())
+        kwargs = dict(opts.kwargs, tokencache=filepath)
+        try:
+            context = binding.connect(**kwargs)
+            self.assertEqual(os.stat(filepath).st_mode & 0777, 0600)
+
+            # A new context uses the cached token rather than logging in
+            cached = binding.connect(**kwargs)
+            self.assertEqual(cached.token, context.token)
+            self.assertEqual(cached.get("/services").status, 200)
+
+            # An invalid cached token is replaced on first use
+            cache = binding.TokenCache(filepath)
+            key = cache.key(
+                context.host, context.port, 
+                context.username, context.namespace)
+            cache.set(key, "Splunk invalid")
+            cached = binding.connect(**kwargs)
+            self.assertEqual(cached.token, "Splunk invalid")
+            self.assertEqual(cached.get("/services").status, 200)
+            self.assertNotEqual(cache.get(key), "Splunk invalid")
+        finally:
+            if path.exists(filepath): os.remove(filepath)
+
     def test_logout(self):
         response = self.context.get("/services")
         self.assertEqual(response.status, 200)
@@ -33,7 +33,7 @@ def wait_event_count(index, count, secs):
     while not done and secs > 0:
         sleep(1)
         secs -= 1 # Approximate
-        done = index['totalEventCount'] == count
+        done = index.refresh()['totalEventCount'] == count
 
 class ServiceTestCase(unittest.TestCase):
     def setUp(self):
@@ -122,6 +122,12 @@ class ServiceTestCase(unittest.TestCase):
         props.delete('sdk-tests')
         self.assertFalse(props.contains('sdk-tests')) 
 
+        # Names are quoted in member paths
+        props.create('sdk tests')
+        self.assertTrue(props.contains('sdk tests'))
+        props.delete('sdk tests')
+        self.assertFalse(props.contains('sdk tests'))
+
     def test_info(self):
         info = self.service.info
         keys = [
@@ -139,6 +145,21 @@ class ServiceTestCase(unittest.TestCase):
             service.indexes.create("sdk-tests")
         self.assertTrue("sdk-tests" in service.indexes())
 
+        # Keyed lookups request the member directly
+        self.assertTrue(service.indexes.contains("sdk-tests"))
+        self.assertFalse(service.indexes.contains("sdk-tests-missing"))
+        self.assertFalse(service.indexes.contains("sdk tests missing"))
+        self.assertRaises(KeyError,
+            lambda: service.indexes["sdk-tests-missing"])
+
+        # Listings are cached for the service's listingttl
+        cached = splunk.client.Service(listingttl=60, **opts.kwargs)
+        cached.login()
+        keys = cached.indexes.list()
+        self.assertEqual(cached.indexes.list(), keys)
+        self.assertTrue(cached.indexes.contains("sdk-tests"))
+        self.assertFalse(cached.indexes.contains("sdk-tests-missing"))
+
         # Scan indexes and make sure the entities look familiar
         attrs = [
             'thawedPath', 'quarantineFutureSecs',
@@ -160,6 +181,10 @@ class ServiceTestCase(unittest.TestCase):
             entity = index.read()
             for attr in attrs: self.assertTrue(attr in entity.keys())
 
+        # The listing populates each index's state without reading it
+        for index in service.indexes.items():
+            for attr in attrs: self.assertTrue(attr in index.state.keys())
+
         index = service.indexes['sdk-tests']
 
         entity = index.read()
@@ -184,12 +209,24 @@ class ServiceTestCase(unittest.TestCase):
         wait_event_count(index, '2', 30)
         self.assertEqual(index['totalEventCount'], '2')
 
+        # Streamed (chunked) event body
+        index.submit(iter(["Hello ", "streaming!!"]))
+        wait_event_count(index, '3', 30)
+        self.assertEqual(index['totalEventCount'], '3')
+
+        # Batched events, several to a request
+        events = ["Hello batch %d" % i for i in range(3)]
+        stats = index.submit_many(events, sourcetype="sdk-tests")
+        self.assertEqual(stats.events, 3)
+        wait_event_count(index, '6', 30)
+        self.assertEqual(index['totalEventCount'], '6')
+
         # test must run on machine where splunkd runs,
         # otherwise an failure is expected
         testpath = path.dirname(path.abspath(__file__))
         index.upload(path.join(testpath, "testfile.txt"))
-        wait_event_count(index, '3', 30)
-        self.assertEqual(index['totalEventCount'], '3')
+        wait_event_count(index, '7', 30)
+        self.assertEqual(index['totalEventCount'], '7')
 
         index.clean()
         self.assertEqual(index['totalEventCount'], '0')
@@ -203,6 +240,11 @@ class ServiceTestCase(unittest.TestCase):
             self.assertTrue(metadata.has_key('eai:acl'))
             self.assertTrue(metadata.has_key('eai:attributes'))
 
+            # Item access is filtered the same way as read
+            self.assertFalse(index.read().has_key('eai:acl'))
+            self.assertRaises(KeyError, index.__getitem__, 'eai:acl')
+            self.assertRaises(KeyError, index.__getitem__, 'type')
+
     def test_inputs(self):
         inputs = self.service.inputs;
 
@@ -238,11 +280,10 @@ class ServiceTestCase(unittest.TestCase):
         return self.wait_for_completion(job, secs = secs)
 
     def wait_for_completion(self, job, secs = 30):
-        done = False
-        while not done and secs > 0:
-            sleep(1)
-            secs -= 1 # Approximate
-            done = bool(int(job['isDone']))
+        try:
+            job.wait(timeout=secs)
+        except RuntimeError:
+            pass # Timed out, leave it to the caller
         return job
 
     def check_properties(self, job, properties, secs = 10):
@@ -277,6 +318,14 @@ class ServiceTestCase(unittest.TestCase):
         job = self.service.jobs.create("search index=sdk-tests")
         self.assertTrue(job.sid in self.service.jobs())
 
+        # Properties are served from one snapshot until it is refreshed
+        self.service.staleness = 60
+        state = job.refresh().state
+        self.assertEqual(job['sid'], job.sid)
+        self.assertTrue(job['isDone'] in ['0', '1'])
+        self.assertTrue(job.state is state)
+        self.assertFalse(job.refresh().state is state)
+
         # Scan jobs and make sure the entities look familiar
         attrs = [
             'cursorTime', 'delegate', 'diskUsage', 'dispatchState',
@@ -295,6 +344,10 @@ class ServiceTestCase(unittest.TestCase):
             entity = job.read()
             for attr in attrs: self.assertTrue(attr in entity.keys())
 
+        # The listing populates each job's state without reading it
+        for job in self.service.jobs.items():
+            for attr in attrs: self.assertTrue(attr in job.state.keys())
+
         # Make sure we can cancel the job
         job.cancel()
         self.assertTrue(job.sid not in self.service.jobs())
@@ -358,6 +411,71 @@ class ServiceTestCase(unittest.TestCase):
         self.assertEqual(results.RESULT, kind)
         self.assertEqual(int(result["count"]), 1)
 
+        # Project the events onto a couple of fields
+        job = self.runjob("search index=sdk-tests | head 1", 10)
+        fields = ["_time", "host"]
+        reader = results.ResultsReader(job.events(fields=fields), fields)
+        rows = [item[1] for item in reader if item[0] == results.RESULT]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(sorted(rows[0].keys()), ["$offset", "_time", "host"])
+
+        # Paged iteration yields the same rows, in order, as a single read
+        job = self.runjob("search index=_internal | head 25", 10)
+        reader = results.ResultsReader(job.results(count=0), fields)
+        expected = [item[1]["_time"] for item in reader
+                    if item[0] == results.RESULT]
+        rows = job.iterresults(pagesize=10, concurrency=3, fields=fields)
+        self.assertEqual([row["_time"] for row in rows], expected)
+        self.assertEqual(len(expected), 25)
+
+        # Stopping early releases the pages read ahead
+        rows = job.iterresults(pagesize=5, concurrency=3, fields=fields)
+        self.assertEqual(rows.next()["_time"], expected[0])
+        rows.close()
+        self.assertEqual(
+            [row["_time"] for row in job.iterresults(pagesize=5)],
+            [row["_time"] for row in job.iterresults(pagesize=25)])
+
+    def test_wait(self):
+        jobs = self.service.jobs
+        created = [jobs.create("search * | head %d" % count)
+                   for count in [1, 2, 3]]
+
+        # Wait on all of them at once, by sid
+        done = jobs.wait_all([job.sid for job in created], timeout=60)
+        self.assertEqual([job.sid for job in done],
+                         [job.sid for job in created])
+        for job in done: self.assertEqual(job.state['isDone'], '1')
+
+        job = created[0].wait(timeout=60)
+        self.assertEqual(job['isDone'], '1')
+        job = created[1].wait(timeout=60, states=["DONE", "FAILED"])
+        self.assertEqual(job['dispatchState'], "DONE")
+        self.assertRaises(KeyError, jobs.wait_all, ["sdk-tests-missing"])
+
+        for job in created: job.cancel()
+
+    def test_async_jobs(self):
+        service = splunk.client.AsyncService(**opts.kwargs)
+        try:
+            service.login().result()
+
+            # Dispatch both searches before waiting on either
+            futures = [
+                service.jobs.create(query, exec_mode="blocking")
+                for query in ["search * | head 1", "search * | head 2"]]
+            jobs = [future.result() for future in futures]
+
+            for job, count in zip(jobs, [1, 2]):
+                reader = results.ResultsReader(job.results().result())
+                kind, result = reader.next()
+                self.assertEqual(results.RESULTS, kind)
+                rows = [item for item in reader if item[0] == results.RESULT]
+                self.assertEqual(len(rows), count)
+                self.assertTrue(job.cancel().result() is job)
+        finally:
+            service.close()
+
     def test_loggers(self):
         service = self.service
 
@@ -477,6 +595,52 @@ class ServiceTestCase(unittest.TestCase):
         users.delete("sdk-user")
         self.assertTrue("sdk-user" not in users())
 
+# Stands in for a job and for the Jobs collection that a _JobPoller polls,
+# each poll advancing the jobs by one step.
+class PollerJob(object):
+    def __init__(self, sid, polls):
+        self.sid = sid
+        self.polls = polls # Number of polls until the job is done
+        self.state = None
+
+class PollerJobs(object):
+    def __init__(self):
+        self.polls = 0
+        self.threads = set()
+
+    def _poll(self, jobs):
+        import threading
+        self.polls += 1
+        self.threads.add(threading.current_thread())
+        for job in jobs:
+            job.polls -= 1
+            job.state = {'isDone': "1" if job.polls <= 0 else "0"}
+        return set(job.sid for job in jobs if job.sid != "unknown")
+
+class JobPollerTestCase(unittest.TestCase):
+    def test_wait(self):
+        jobs = PollerJobs()
+        poller = splunk.client._JobPoller(jobs)
+        try:
+            waits = [PollerJob("sid%d" % i, 1 + i % 3) for i in range(20)]
+            futures = [poller.wait(job, 5, result=job) for job in waits]
+            for job, future in zip(waits, futures):
+                self.assertTrue(future.result(5) is job)
+            self.assertEqual(len(jobs.threads), 1)
+            self.assertTrue(jobs.polls < len(waits))
+
+            future = poller.wait(PollerJob("unknown", 1), 5)
+            self.assertTrue(isinstance(future.exception(5), KeyError))
+
+            future = poller.wait(PollerJob("slow", 10 ** 6), 0.1)
+            self.assertTrue(isinstance(future.exception(5), RuntimeError))
+
+            future = poller.wait(PollerJob("pending", 10 ** 6))
+        finally:
+            poller.close()
+        self.assertTrue(isinstance(future.exception(5), RuntimeError))
+        self.assertRaises(ValueError, poller.wait, PollerJob("late", 1))
+
 def runone(testname):
     suite = unittest.TestSuite()
     suite.addTest(ServiceTestCase(testname))
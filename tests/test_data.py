@@ -13,6 +13,7 @@
 # under the License.
 
 from os import path
+from StringIO import StringIO
 import sys
 import unittest
 
@@ -192,6 +193,35 @@ class TestCase(unittest.TestCase):
         self.assertEqual(result, 
             {'content': [{'n1':"v1"}, {'n2':"v2"}, {'n3':"v3"}, {'n4':"v4"}]})
 
+    def test_iterload(self):
+        """Test incremental loading against load."""
+        testpath = path.dirname(path.abspath(__file__))
+        atom = "{http://www.w3.org/2005/Atom}%s"
+
+        for filename in ["services.xml", "services.server.info.xml"]:
+            text = open(path.join(testpath, filename), 'r').read()
+            entry = data.load(text).feed.entry
+            if not isinstance(entry, list): entry = [entry]
+            fh = open(path.join(testpath, filename), 'r')
+            result = [item.entry 
+                      for item in data.iterload(fh, atom % "entry")]
+            self.assertEqual(result, entry)
+
+            match = "%s/%s/*" % (atom % "entry", atom % "content")
+            fh = open(path.join(testpath, filename), 'r')
+            result = list(data.iterload(fh, match))
+            expected = data.load(text, match)
+            if expected is None: expected = []
+            if not isinstance(expected, list): expected = [expected]
+            self.assertEqual(result, expected)
+
+        text = "<a><b>1</b><c/><b>2</b></a>"
+        result = list(data.iterload(StringIO(text), "b"))
+        self.assertEqual(result, [{'b': "1"}, {'b': "2"}])
+
+        result = list(data.iterload(StringIO(""), "b"))
+        self.assertEqual(result, [])
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -143,6 +143,13 @@ class ExamplesTestCase(unittest.TestCase):
         result = run("info.py")
         self.assertEquals(result, 0)
 
+    def test_inputbench(self):
+        commands = [
+            "inputbench.py --help",
+            "inputbench.py --count=100 sdk-tests",
+        ]
+        for command in commands: self.assertEquals(run(command), 0)
+
     def test_inputs(self):
         commands = [
             "inputs.py --help",
@@ -351,7 +358,7 @@ def wait_event_count(index, count, secs):
     while not done and secs > 0:
         time.sleep(1)
         secs -= 1 # Approximate
-        done = index['totalEventCount'] == count
+        done = index.refresh()['totalEventCount'] == count
 
 def main():
     global opts
@@ -0,0 +1,450 @@
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from datetime import datetime
+import os
+import shutil
+import socket
+from StringIO import StringIO
+import struct
+import tempfile
+import threading
+from time import sleep
+import unittest
+
+import splunk.binding as binding
+from splunk.data import record
+import splunk.ingest as ingest
+
+# A local socket server that records what is sent on each connection.
+# The first 'drops' connections are reset once the request head has been
+# received, after which the server stops listening if 'refuse' is set. If
+# 'after' is given, they are instead closed once 'after' more bytes have
+# been received.
+class Receiver(object):
+    def __init__(self, drops=0, refuse=False, after=None):
+        self.drops = drops
+        self.refuse = refuse
+        self.after = after
+        self.received = [] # Data received, per connection
+        self.dropped = threading.Event()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(5)
+        self.listener.settimeout(0.05)
+        self.port = self.listener.getsockname()[1]
+        self.threads = []
+        self.stopping = False
+        self.acceptor = threading.Thread(target=self.accept)
+        self.acceptor.daemon = True
+        self.acceptor.start()
+
+    # Accept connections until stopping and none are waiting
+    def accept(self):
+        while True:
+            try:
+                connection, address = self.listener.accept()
+            except socket.timeout:
+                if self.stopping: return
+                continue
+            connection.settimeout(None)
+            if self.drops > 0:
+                self.drops -= 1
+                head = ""
+                while "\r\n\r\n" not in head: head += connection.recv(1024)
+                if self.after is None:
+                    linger = struct.pack("ii", 1, 0) # Reset on close
+                    connection.setsockopt(
+                        socket.SOL_SOCKET, socket.SO_LINGER, linger)
+                else:
+                    size = len(head.split("\r\n\r\n", 1)[1])
+                    while size < self.after:
+                        size += len(connection.recv(self.after - size))
+                connection.close()
+                self.dropped.set()
+                if self.drops == 0 and self.refuse:
+                    self.listener.close()
+                    return
+                continue
+            chunks = []
+            self.received.append(chunks)
+            thread = threading.Thread(
+                target=self.receive, args=(connection, chunks))
+            thread.start()
+            self.threads.append(thread)
+
+    def receive(self, connection, chunks):
+        while True:
+            chunk = connection.recv(65536)
+            if len(chunk) == 0: break
+            chunks.append(chunk)
+        connection.close()
+
+    def close(self):
+        self.stopping = True
+        self.acceptor.join()
+        self.listener.close()
+        for thread in self.threads: thread.join()
+        return ["".join(chunks) for chunks in self.received]
+
+def context(port):
+    result = binding.Context(host="127.0.0.1", port=port, scheme="http")
+    result.token = "Splunk token"
+    return result
+
+PATH = "receivers/stream?index=main"
+
+# Stands in for a service, recording the requests posted to it
+class Recorder(object):
+    def __init__(self, delay=0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.posts = []
+        self.active = 0 # Requests in progress
+        self.peak = 0 # Most requests in progress at once
+        self.lock = threading.Lock()
+
+    def post(self, path, body, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+            if self.fail: raise IOError("post failed")
+            self.posts.append((path, body, kwargs))
+        return record({'status': 200, 'body': StringIO("")})
+
+class EventEncoderTestCase(unittest.TestCase):
+    def test_encode(self):
+        encoder = ingest.EventEncoder(["b", "a"])
+        self.assertEqual(encoder.encode({'a': "1", 'b': "2"}), 'b="2" a="1"')
+
+        # Other fields follow in sorted order, None values are left out
+        event = encoder.encode({'a': 1.5, 'd': None, 'c': [1, "x"]})
+        self.assertEqual(event, 'a="1.5" c="1,x"')
+        self.assertTrue(event is encoder.buffer) # Reused
+
+        self.assertRaises(TypeError, encoder.encode, {'a': {}})
+
+    def test_escape(self):
+        encoder = ingest.EventEncoder(["a"])
+        self.assertEqual(encoder.encode({'a': 'say "hi"\\\r\n'}),
+                         'a="say \\"hi\\"\\\\\\r\\n"')
+        self.assertEqual(encoder.encode({'a': u"\xe9", 'b': u'"'}),
+                         'a="\xc3\xa9" b="\\""')
+
+    def test_write(self):
+        encoder = ingest.EventEncoder(["a"], timestamp=True, terminator="\n")
+        buffer = bytearray()
+        encoder.write(buffer, {'a': "1"}, datetime(2011, 6, 1, 12, 30))
+        encoder.write(buffer, {}, "12:31")
+        encoder.write(buffer, {'a': "3"})
+        lines = str(buffer).splitlines()
+        self.assertEqual(lines[:2], ['2011-06-01T12:30:00 a="1"', "12:31"])
+        self.assertTrue(lines[2].startswith(str(datetime.now().year)))
+        self.assertTrue(lines[2].endswith(' a="3"'))
+
+class StreamWriterTestCase(unittest.TestCase):
+    def assertHead(self, data):
+        head, body = data.split("\r\n\r\n", 1)
+        lines = head.split("\r\n")
+        self.assertEqual(lines[0], "POST /services/%s HTTP/1.1" % PATH)
+        self.assertTrue("Authorization: Splunk token" in lines)
+        self.assertTrue("X-Splunk-Input-Mode: Streaming" in lines)
+        return body
+
+    def test_write(self):
+        receiver = Receiver()
+        events = ["event %d\n" % i for i in range(20000)]
+        writer = ingest.StreamWriter(
+            context(receiver.port), PATH, bufsize=4096, maxbuffer=16384)
+        for event in events: writer.write(event)
+        writer.close()
+        self.assertRaises(ValueError, writer.write, "late\n")
+        received = receiver.close()
+        self.assertEqual(len(received), 1)
+        self.assertEqual(self.assertHead(received[0]), "".join(events))
+
+        stats = writer.stats()
+        self.assertEqual(stats.events, len(events))
+        self.assertEqual(stats.bytes, len("".join(events)))
+        self.assertEqual(stats.reconnects, 0)
+        self.assertTrue(stats.events_per_sec > 0)
+
+    def test_linger(self):
+        receiver = Receiver()
+        writer = ingest.StreamWriter(
+            context(receiver.port), PATH, linger=0.05)
+        writer.write(u"one\n")
+        sleep(0.5) # Sent without a flush, once it has lingered
+        self.assertEqual(writer.bytes, 4)
+        writer.write("two\n")
+        writer.flush()
+        self.assertEqual(writer.bytes, 8)
+        writer.close()
+        received = receiver.close()
+        self.assertEqual(self.assertHead(received[0]), "one\ntwo\n")
+
+    def test_reconnect(self):
+        receiver = Receiver(drops=1)
+        writer = ingest.StreamWriter(context(receiver.port), PATH)
+        receiver.dropped.wait(5)
+        sleep(0.1) # Let the reset arrive
+        writer.write("event\n")
+        writer.close()
+        received = receiver.close()
+        self.assertEqual(writer.reconnects, 1)
+        self.assertEqual(self.assertHead(received[0]), "event\n")
+
+    def test_dropped(self):
+        # The receiver closes the connection between writes, the write that
+        # follows is not lost, and the write before it is resent too.
+        receiver = Receiver(drops=1, after=len("one\n"))
+        writer = ingest.StreamWriter(context(receiver.port), PATH)
+        writer.write("one\n")
+        writer.flush()
+        receiver.dropped.wait(5)
+        sleep(0.1) # Let the close arrive
+        writer.write("two\n")
+        writer.close()
+        received = receiver.close()
+        self.assertEqual(writer.reconnects, 1)
+        self.assertEqual(self.assertHead(received[0]), "one\ntwo\n")
+
+    def test_error(self):
+        receiver = Receiver(drops=1, refuse=True)
+        writer = ingest.StreamWriter(context(receiver.port), PATH, retries=1)
+        receiver.dropped.wait(5)
+        sleep(0.1)
+        writer.write("event\n")
+        self.assertRaises(socket.error, writer.flush)
+        self.assertRaises(socket.error, writer.write, "event\n")
+        self.assertRaises(socket.error, writer.close)
+        receiver.close()
+
+class BatchSubmitterTestCase(unittest.TestCase):
+    def test_submit(self):
+        service = Recorder(delay=0.01)
+        submitter = ingest.BatchSubmitter(
+            service, batchsize=1000, concurrency=3)
+        for i in range(1000):
+            sourcetype = "even" if i % 2 == 0 else "odd"
+            submitter.submit("event %d" % i, "main", sourcetype=sourcetype)
+        submitter.close()
+        self.assertRaises(ValueError, submitter.submit, "late")
+
+        # Events are batched by metadata, in order within each batch
+        events = {}
+        for path, body, kwargs in service.posts:
+            self.assertEqual(path, "receivers/simple")
+            self.assertEqual(kwargs['index'], "main")
+            self.assertFalse('host' in kwargs)
+            self.assertTrue(len(body) < 1000 + len("event 999\n"))
+            events.setdefault(kwargs['sourcetype'], []).append(body)
+        for sourcetype, remainder in [("even", 0), ("odd", 1)]:
+            lines = "".join(events[sourcetype]).splitlines()
+            expected = ["event %d" % i
+                        for i in range(1000) if i % 2 == remainder]
+            self.assertEqual(sorted(lines), sorted(expected))
+
+        self.assertTrue(1 < service.peak <= 3)
+        stats = submitter.stats()
+        self.assertEqual(stats.events, 1000)
+        self.assertEqual(stats.posts, len(service.posts))
+
+    def test_linger(self):
+        service = Recorder()
+        submitter = ingest.BatchSubmitter(service, linger=0.05, separator="|")
+        buffer = bytearray("one")
+        submitter.submit(buffer, "main")
+        buffer[:] = "two" # The submitter keeps its own copy
+        submitter.submit("two|", "main")
+        sleep(0.5) # Posted without a flush, once it has lingered
+        self.assertEqual([post[1] for post in service.posts], ["one|two|"])
+        submitter.close()
+
+    def test_error(self):
+        service = Recorder(fail=True)
+        submitter = ingest.BatchSubmitter(service)
+        submitter.submit("one", "main")
+        submitter.submit("two", "main", sourcetype="x")
+        try:
+            submitter.flush()
+            self.fail("Expected IOError")
+        except IOError as e: # The failed batches are handed back
+            failed = sorted(e.batches)
+        self.assertEqual(failed, [
+            ({'index': "main"}, "one\n"),
+            ({'index': "main", 'sourcetype': "x"}, "two\n")])
+
+        # The error is raised once, the failed batches can be resubmitted
+        service.fail = False
+        for metadata, body in failed: submitter.submit(body, **metadata)
+        submitter.close()
+        self.assertEqual(sorted(post[1] for post in service.posts),
+                         ["one\n", "two\n"])
+
+# Stands in for a service's inputs, recording the inputs created
+class Inputs(object):
+    def __init__(self, *keys):
+        self.keys = list(keys)
+        self.created = []
+
+    def contains(self, key):
+        return key in self.keys
+
+    def create(self, kind, name, **kwargs):
+        self.created.append((kind, name, kwargs))
+        self.keys.append(self.itemkey(kind, name))
+
+    def itemkey(self, kind, name):
+        return "%s:%s" % (kind, name)
+
+class InputSenderTestCase(unittest.TestCase):
+    def test_tcp(self):
+        receiver = Receiver()
+        service = record({'host': "127.0.0.1", 'inputs': Inputs()})
+        sender = ingest.InputSender(
+            service, receiver.port, connections=3, bufsize=1000,
+            index="main")
+        self.assertEqual(service.inputs.created,
+                         [("tcp", receiver.port, {'index': "main"})])
+        events = ["event %d\n" % i for i in range(3000)]
+        for event in events: sender.write(event)
+        sender.close()
+        received = receiver.close()
+
+        # Events are spread over the connections, whole and in order on each
+        self.assertEqual(len(received), 3)
+        lines = []
+        for data in received:
+            self.assertTrue(len(data) > 0)
+            self.assertTrue(data.endswith("\n"))
+            chunk = data.splitlines()
+            self.assertEqual(chunk, sorted(chunk, key=lambda line:
+                                           int(line.split()[1])))
+            lines.extend(chunk)
+        self.assertEqual(sorted(lines), sorted(event[:-1] for event in events))
+
+        stats = sender.stats()
+        self.assertEqual(stats.events, len(events))
+        self.assertEqual(stats.bytes, len("".join(events)))
+        self.assertEqual(stats.connections, 3)
+
+    def test_udp(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        listener.bind(("127.0.0.1", 0))
+        listener.settimeout(5)
+        port = listener.getsockname()[1]
+        inputs = Inputs("udp:%d" % port)
+        service = record({'host': "127.0.0.1", 'inputs': inputs})
+        with ingest.InputSender(service, port, kind="udp") as sender:
+            sender.write(u"one\n")
+            sender.write("two\n")
+        self.assertEqual(service.inputs.created, [])
+        datagrams = [listener.recv(1024) for i in range(2)]
+        listener.close()
+        self.assertEqual(sorted(datagrams), ["one\n", "two\n"])
+        self.assertRaises(
+            ValueError, ingest.InputSender, service, port, "splunktcp")
+
+class SpoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.endswith(".spool"))
+
+    def test_submit(self):
+        service = Recorder()
+        with ingest.Spool(service, self.directory, batchsize=100) as spool:
+            for i in range(100):
+                spool.submit("event %d" % i, "main", host=u"h\xe9")
+            spool.flush(5)
+        self.assertRaises(ValueError, spool.submit, "late")
+
+        body = "".join(post[1] for post in service.posts)
+        self.assertEqual(body, "".join("event %d\n" % i for i in range(100)))
+        for path, body, kwargs in service.posts:
+            self.assertEqual(path, "receivers/simple")
+            self.assertTrue(len(body) < 100 + len("event 99\n"))
+            self.assertEqual(kwargs, {'index': "main", 'host': "h\xc3\xa9"})
+        stats = spool.stats()
+        self.assertEqual(stats.events, 100)
+        self.assertEqual(stats.failures, 0)
+
+    def test_replay(self):
+        # Events spooled while shipping fails are shipped once the
+        # directory is spooled from again.
+        service = Recorder(fail=True)
+        spool = ingest.Spool(service, self.directory, segmentsize=64)
+        for i in range(10): spool.submit("event %d" % i, "main")
+        self.assertRaises(RuntimeError, spool.flush, 0.2)
+        self.assertTrue(spool.failures > 0)
+        self.assertTrue(isinstance(spool.error, IOError))
+        spool.sync()
+        spool.close()
+        self.assertTrue(len(self.segments()) > 1) # Rotated
+
+        service = Recorder()
+        with ingest.Spool(service, self.directory) as spool:
+            spool.submit("event 10", "main")
+            spool.flush(5)
+        lines = "".join(post[1] for post in service.posts).splitlines()
+        self.assertEqual(lines, ["event %d" % i for i in range(11)])
+        self.assertEqual(len(self.segments()), 1) # Shipped ones are removed
+
+        # Nothing is shipped twice once acknowledged
+        service = Recorder()
+        with ingest.Spool(service, self.directory) as spool:
+            spool.flush(5)
+        self.assertEqual(service.posts, [])
+
+    def test_checkpoint(self):
+        # Shipping resumes from the last acknowledged event
+        service = Recorder()
+        spool = ingest.Spool(service, self.directory)
+        spool.submit("one", "main")
+        spool.flush(5)
+        service.fail = True
+        spool.submit("two", "main")
+        sleep(0.2)
+        spool.close()
+
+        service = Recorder()
+        with ingest.Spool(service, self.directory) as spool:
+            spool.flush(5)
+        self.assertEqual([post[1] for post in service.posts], ["two\n"])
+
+    def test_empty(self):
+        # A segment left empty by a crash is removed on recovery
+        service = Recorder(fail=True)
+        spool = ingest.Spool(service, self.directory)
+        spool.submit("one", "main")
+        spool.close()
+        open(os.path.join(self.directory, "%016d.spool" % 9), "wb").close()
+
+        service = Recorder()
+        with ingest.Spool(service, self.directory) as spool:
+            spool.flush(5)
+        self.assertEqual([post[1] for post in service.posts], ["one\n"])
+        self.assertFalse("%016d.spool" % 9 in self.segments())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+# Copyright 2011 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"): you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from os import path
+from StringIO import StringIO
+import unittest
+
+import splunk.results as results
+
+class TestCase(unittest.TestCase):
+    def test_real(self):
+        """Test a real Splunk search results stream."""
+        testpath = path.dirname(path.abspath(__file__))
+        reader = results.ResultsReader(
+            open(path.join(testpath, "results200.xml"), 'r'))
+
+        kinds = {}
+        first = None
+        for kind, value in reader:
+            kinds[kind] = kinds.get(kind, 0) + 1
+            if kind == results.RESULTS:
+                self.assertEqual(value, {'preview': "0"})
+            if kind == results.MESSAGE:
+                self.assertEqual(value['type'], "DEBUG")
+            if kind == results.RESULT and first is None: 
+                first = value
+        self.assertEqual(kinds, 
+            { results.RESULTS: 6, results.MESSAGE: 2, results.RESULT: 1349 })
+
+        self.assertEqual(first['$offset'], "0")
+        self.assertEqual(first['_cd'], "0:39987")
+        self.assertEqual(first['_si'], ["blovering.local-root", "main"])
+        self.assertEqual(first['_raw'], 
+            '<v trunc="0" xml:space="preserve">12.1.1.140 - - '
+            '[08/Aug/2009:01:13:31 -0700] &quot;GET /favicon.ico HTTP/1.1'
+            '&quot; <sg h="1">404</sg> 170 &quot;-&quot; &quot;Mozilla/5.0 '
+            '(Macintosh; U; PPC Mac OS X Mach-O; en-US; sl:1.7.7) '
+            'Gecko/00010100 Firefox/1.0.3&quot;</v>')
+
+    def test_fields(self):
+        reader = results.ResultsReader(StringIO("""
+            <results preview='1'>
+              <meta>
+                <fieldOrder><field>a</field><field>b</field></fieldOrder>
+              </meta>
+              <result offset='0'>
+                <field k='a'><value><text>caf\xc3\xa9</text></value></field>
+                <field k='b'><value><text> </text></value></field>
+              </result>
+            </results>"""))
+        self.assertEqual(reader.read(), results.RESULTS)
+        self.assertEqual(reader.value, {'preview': "1"})
+        self.assertEqual(reader.fields, ["a", "b"])
+        self.assertEqual(reader.read(), results.RESULT)
+        self.assertEqual(reader.value, 
+            {'$offset': "0", 'a': "caf\xc3\xa9", 'b': ""})
+        self.assertEqual(reader.read(), None)
+
+        reader = results.ResultsReader(StringIO(""))
+        self.assertEqual(reader.read(), None)
+
+    def test_batches(self):
+        testpath = path.dirname(path.abspath(__file__))
+        reader = results.ResultsReader(
+            open(path.join(testpath, "results200.xml"), 'r'))
+        batches = list(reader.batches(500))
+        self.assertEqual(
+            sum([len(batch['_cd']) for batch in batches]), 1349)
+        for batch in batches:
+            self.assertTrue(len(batch['_raw']) <= 500)
+            self.assertEqual(len(batch), 14) # 13 fields and '$offset'
+        self.assertEqual(batches[0]['$offset'][0], "0")
+        self.assertEqual(
+            batches[0]['_si'][0], ["blovering.local-root", "main"])
+
+        reader = results.ResultsReader(StringIO("""
+            <results preview='0'>
+              <meta><fieldOrder><field>a</field></fieldOrder></meta>
+              <result offset='0'>
+                <field k='a'><value><text>1</text></value></field>
+              </result>
+              <result offset='1'>
+                <field k='b'><value><text>x</text></value></field>
+              </result>
+              <result offset='2'>
+                <field k='a'><value><text>2.5</text></value></field>
+              </result>
+            </results>"""))
+        self.assertEqual(list(reader.batches()), [{
+            '$offset': ["0", "1", "2"], 
+            'a': ["1", None, "2.5"], 
+            'b': [None, "x", None]
+        }])
+
+        # Non-ASCII field names key the same column in the field order and
+        # in the results
+        reader = results.ResultsReader(StringIO("""
+            <results preview='0'>
+              <meta><fieldOrder><field>caf\xc3\xa9</field></fieldOrder></meta>
+              <result offset='0'>
+                <field k='caf\xc3\xa9'><value><text>1</text></value></field>
+              </result>
+            </results>"""))
+        self.assertEqual(list(reader.batches()), [{
+            '$offset': ["0"],
+            'caf\xc3\xa9': ["1"]
+        }])
+        self.assertEqual(reader.fields, ["caf\xc3\xa9"])
+
+        if results.numpy is None: return
+        reader = results.ResultsReader(
+            open(path.join(testpath, "results200.xml"), 'r'))
+        batch = reader.batches(2000, arrays=True).next()
+        self.assertEqual(batch['_serial'].dtype, results.numpy.int64)
+        self.assertEqual(batch['_si'].dtype, object)
+
+    def test_project(self):
+        testpath = path.dirname(path.abspath(__file__))
+        reader = results.ResultsReader(
+            open(path.join(testpath, "results200.xml"), 'r'), 
+            ["_time", "host", "unknown"])
+        self.assertEqual(reader.read(), results.RESULTS)
+        self.assertEqual(reader.fields, ["_time", "host"])
+        for kind, value in reader:
+            if kind != results.RESULT: continue
+            self.assertEqual(
+                sorted(value.keys()), ["$offset", "_time", "host"])
+
+    def test_rows(self):
+        testpath = path.dirname(path.abspath(__file__))
+        reader = results.ResultsReader(
+            open(path.join(testpath, "results200.xml"), 'r'))
+        first = [value for kind, value in reader if kind == results.RESULT][0]
+        self.assertEqual(type(first), dict) # Unless compact
+
+        reader = results.ResultsReader(
+            open(path.join(testpath, "results200.xml"), 'r'), compact=True)
+        rows = [value for kind, value in reader if kind == results.RESULT]
+        self.assertEqual(rows[0], first)
+
+        # Rows of a section share a single schema
+        self.assertTrue(rows[0]._schema is rows[1]._schema)
+        row = rows[0]
+        self.assertTrue(isinstance(row, results.Row))
+        self.assertEqual(len(row), 14)
+        self.assertEqual(row['host'], "blovering.local")
+        self.assertEqual(row.get('unknown', 42), 42)
+        self.assertRaises(KeyError, row.__getitem__, 'unknown')
+        self.assertTrue('host' in row and row.has_key('_raw'))
+        self.assertEqual(dict(row), dict(row.items()))
+        self.assertEqual(sorted(row), sorted(row.keys()))
+
+        row['extra'] = "1"
+        self.assertEqual(row['extra'], "1")
+        self.assertFalse('extra' in rows[1])
+        del row['extra']
+        self.assertFalse('extra' in row)
+        self.assertEqual(len(row), 14)
+
+    def test_streams(self):
+        # Chunks are passed through as is, not copied
+        chunk = "<result/>" * 1000
+        stream = results.ListStream("<doc>", StringIO(chunk), chunk, "</doc>")
+        self.assertEqual(stream.read(1024), "<doc>")
+        self.assertEqual(stream.read(1024), chunk[:1024])
+        self.assertEqual(len(stream.read(len(chunk))), len(chunk) - 1024)
+        self.assertTrue(stream.read(len(chunk)) is chunk)
+        self.assertEqual(stream.read(1024), "</doc>")
+        self.assertEqual(stream.read(1024), "")
+
+        # The head may span several reads
+        head = "<?xml version='1.0'?>\n<!-- %s -->" % ("x" * 10000)
+        stream = results.XMLStream(StringIO(head + chunk))
+        self.assertEqual(stream.read(), head + "<doc>" + chunk + "</doc>\n")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -59,6 +59,11 @@ RULES_SPLUNK = {
         'flags': ["--namespace"], 
         'default': None,
     },
+    'tokencache': {
+        'flags': ["--tokencache"],
+        'default': None,
+        'help': "File in which to cache session tokens (eg: ~/.splunktokens)"
+    },
 }
 
 FLAGS_SPLUNK = RULES_SPLUNK.keys()